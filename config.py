@@ -13,3 +13,23 @@ TABLE_KEYS = {
     'DS.MD_EXCHANGE_RATE_D': ['data_actual_date', 'currency_rk'],
     'DS.MD_LEDGER_ACCOUNT_S': ['ledger_account', 'start_date']
 }
+
+# Размер общего пула соединений (модуль db.py): minconn открываются при создании пула,
+# возвращенные соединения держатся свободными до maxconn; acquire_timeout - сколько секунд ждать
+# свободного соединения, прежде чем выбросить PoolError
+POOL_CONFIG = {
+    'minconn': 1,
+    'maxconn': 8,
+    'acquire_timeout': 30
+}
+
+# Параметры сессии для разных типов нагрузки, применяются при выдаче соединения из пула
+SESSION_SETTINGS = {
+    'default': {},
+    # Загрузка DS: данные можно перезагрузить из CSV, поэтому ожидание fsync при коммите не нужно
+    'etl': {'synchronous_commit': 'off', 'work_mem': '64MB', 'maintenance_work_mem': '256MB'},
+    # Расчет витрин DM: сортировки и хэш-соединения по проводкам и остаткам
+    'dm': {'work_mem': '128MB'},
+    # Отчеты и выгрузки
+    'report': {'work_mem': '64MB'}
+}
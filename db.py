@@ -0,0 +1,177 @@
+"""
+Общий модуль работы с базой данных для всех заданий:
+пул соединений psycopg2, параметры сессии по типу нагрузки и статистика пула.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+import psycopg2
+from psycopg2 import pool
+from config import DB_CONFIG, POOL_CONFIG, SESSION_SETTINGS
+
+class ConnectionPool(pool.ThreadedConnectionPool):
+    """Пул соединений: при отсутствии свободного соединения ждет его освобождения не дольше
+    acquire_timeout секунд (None - без ограничения), затем выбрасывает PoolError
+    (стандартный пул выбрасывает ее сразу), и ведет статистику"""
+
+    def __init__(self, minconn, maxconn, *args, acquire_timeout=None, **kwargs):
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'connections_created': 0,
+            'checkouts': 0,
+            'in_use': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0
+        }
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _putconn(self, conn, key=None, close=False):
+        # Стандартный пул закрывает возвращенное соединение, если свободных уже minconn, и следующая
+        # параллельная выдача открывает новое; держим свободными до maxconn (вызов идет под self._lock)
+        minconn = self.minconn
+        self.minconn = self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        with self._stats_lock:
+            self.stats['connections_created'] += 1
+        return conn
+
+    @contextmanager
+    def connection(self, workload='default'):
+        """Выдача соединения с параметрами сессии для нагрузки workload.
+        При ошибке транзакция откатывается, при возврате в пул параметры сессии сбрасываются"""
+        start = time.perf_counter()
+        # Ожидание без ограничения зависло бы навсегда, если все соединения заняты потоками,
+        # каждый из которых ждет второе соединение
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise pool.PoolError(f"Нет свободного соединения в пуле за {self.acquire_timeout} с")
+        waited = time.perf_counter() - start
+
+        try:
+            conn = self.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self.stats['checkouts'] += 1
+            self.stats['in_use'] += 1
+            self.stats['wait_time'] += waited
+            self.stats['max_wait_time'] = max(self.stats['max_wait_time'], waited)
+
+        try:
+            settings = SESSION_SETTINGS.get(workload, {})
+            if settings:
+                with conn.cursor() as cur:
+                    for name, value in settings.items():
+                        cur.execute("SELECT set_config(%s, %s, false);", (name, str(value)))
+                # Фиксируем сразу: SET внутри откаченной транзакции тоже откатывается
+                conn.commit()
+            yield conn
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                    conn.autocommit = False
+                    with conn.cursor() as cur:
+                        cur.execute("RESET ALL;")
+                    conn.commit()
+                except psycopg2.Error:
+                    broken = True
+            self.putconn(conn, close=broken)
+            with self._stats_lock:
+                self.stats['in_use'] -= 1
+            self._slots.release()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Функция для получения общего пула (создается при первом обращении в каждом процессе)"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Соединения родительского процесса нельзя использовать после fork
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool(POOL_CONFIG['minconn'], POOL_CONFIG['maxconn'],
+                                   acquire_timeout=POOL_CONFIG['acquire_timeout'], **DB_CONFIG)
+            _pool_pid = os.getpid()
+        return _pool
+
+def get_connection(workload='default'):
+    """Контекстный менеджер для получения соединения из общего пула:
+    with get_connection('dm') as conn: ..."""
+    return get_pool().connection(workload)
+
+def connect(**overrides):
+    """Функция для отдельного соединения вне пула (например, к системной БД postgres)"""
+    return psycopg2.connect(**{**DB_CONFIG, **overrides})
+
+def analyze_tables(conn, tables, commit=True):
+    """Функция для обновления статистики планировщика (ANALYZE) после массовой загрузки или расчета"""
+    with conn.cursor() as cur:
+        for table in tables:
+            cur.execute(f"ANALYZE {table};")
+    if commit:
+        conn.commit()
+
+def ensure_month_partitions(conn, table, date_from, date_to, commit=True):
+    """Функция для создания недостающих месячных секций table_ГГГГ_ММ секционированной таблицы table
+    на период [date_from, date_to] (секции по умолчанию нет - строка вне секций не вставится).
+    Для несекционированной таблицы ничего не делает. Возвращает число созданных секций"""
+    created = 0
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                    (table,))
+        if not cur.fetchone()[0]:
+            return 0
+        month = date_from.replace(day=1)
+        while month <= date_to:
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            partition = f"{table}_{month:%Y_%m}"
+            cur.execute("SELECT to_regclass(%s) IS NULL", (partition,))
+            if cur.fetchone()[0]:
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                            f"FOR VALUES FROM (%s) TO (%s);", (month, next_month))
+                created += 1
+            month = next_month
+    if commit:
+        conn.commit()
+    return created
+
+def pool_stats():
+    """Функция для получения статистики пула: создано соединений, выдач, время ожидания"""
+    if _pool is None or _pool_pid != os.getpid():
+        return None
+    with _pool._stats_lock:
+        return dict(_pool.stats)
+
+def print_pool_stats():
+    """Функция для вывода статистики пула"""
+    stats = pool_stats()
+    if stats is None:
+        return
+    print(f"🔌 Пул соединений: создано {stats['connections_created']}, выдач {stats['checkouts']}, "
+          f"ожидание {stats['wait_time']:.3f} с (макс. {stats['max_wait_time']:.3f} с)")
+
+def close_pool():
+    """Функция для закрытия всех соединений пула"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
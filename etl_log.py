@@ -0,0 +1,165 @@
+"""
+Буферизованное логирование ETL в LOGS.etl_logs.
+События копятся в памяти и записываются одной транзакцией на границе этапа
+(или сразу при ошибке); все события одного запуска связаны общим run_id.
+"""
+import threading
+import uuid
+from datetime import datetime
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_values
+from db import get_connection
+
+create_logs_sql = """
+CREATE SCHEMA IF NOT EXISTS LOGS;
+
+CREATE TABLE IF NOT EXISTS LOGS.etl_logs (
+    id SERIAL PRIMARY KEY,
+    table_name VARCHAR(100),
+    status VARCHAR(20),
+    rows_loaded INTEGER,
+    start_time TIMESTAMP,
+    end_time TIMESTAMP,
+    message TEXT,
+    run_id VARCHAR(32)
+);
+
+ALTER TABLE LOGS.etl_logs ADD COLUMN IF NOT EXISTS run_id VARCHAR(32);
+CREATE INDEX IF NOT EXISTS etl_logs_run_id_idx ON LOGS.etl_logs (run_id);
+"""
+
+# Схема уже создана: колонка run_id и индекс по ней есть. ALTER TABLE ... ADD COLUMN IF NOT EXISTS
+# и CREATE INDEX IF NOT EXISTS берут блокировку таблицы даже без изменений, поэтому сначала проверяем каталог
+schema_ready_sql = """
+SELECT EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_schema = 'logs' AND table_name = 'etl_logs' AND column_name = 'run_id')
+   AND to_regclass('LOGS.etl_logs_run_id_idx') IS NOT NULL;
+"""
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def ensure_schema(conn):
+    """Функция для создания схемы и таблицы логов (один раз за процесс; DDL выполняется,
+    только если таблицы, колонки run_id или индекса еще нет)"""
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with conn.cursor() as cur:
+            cur.execute(schema_ready_sql)
+            if not cur.fetchone()[0]:
+                cur.execute(create_logs_sql)
+        conn.commit()
+        _schema_ready = True
+
+class EtlLogger:
+    """Журнал событий одного запуска ETL: start/end только меняют буфер в памяти,
+    flush записывает накопленные изменения в LOGS.etl_logs одной транзакцией"""
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._events = {}
+        self._next_id = 1
+
+    def start(self, table_name, message=None):
+        """Регистрация начала этапа. Возвращает идентификатор события для end"""
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events[event_id] = {
+                'table_name': table_name,
+                'status': 'STARTED',
+                'rows_loaded': None,
+                'start_time': datetime.now(),
+                'end_time': None,
+                'message': message,
+                'db_id': None,
+                'dirty': True
+            }
+        print(f"📝 {table_name}: этап начат (запуск {self.run_id[:8]})")
+        return event_id
+
+    def end(self, event_id, rows_loaded, status='SUCCESS', message=None):
+        """Регистрация окончания этапа; при status='FAILED' буфер сразу сбрасывается в БД"""
+        if event_id is None:
+            return
+        with self._lock:
+            event = self._events[event_id]
+            event.update(
+                status=status,
+                rows_loaded=rows_loaded,
+                end_time=datetime.now(),
+                message=message or event['message'] or f"Загружено {rows_loaded} записей",
+                dirty=True
+            )
+        print(f"📝 {event['table_name']}: этап завершен ({status}), {rows_loaded} записей.")
+        if status == 'FAILED':
+            self.flush()
+
+    def flush(self, conn=None):
+        """Запись накопленных событий в LOGS.etl_logs одной транзакцией.
+        Новые события вставляются, уже записанные - обновляются; если соединение получить не удалось,
+        события остаются в буфере до следующего сброса. Возвращает число записанных событий"""
+        if conn is None:
+            try:
+                with get_connection('etl') as conn:
+                    return self.flush(conn)
+            except (psycopg2.OperationalError, pool.PoolError) as e:
+                print(f"⚠️ Ошибка записи логов: {e}")
+                return 0
+
+        with self._lock:
+            pending = [(event_id, dict(event)) for event_id, event in self._events.items() if event['dirty']]
+        if not pending:
+            return 0
+
+        columns = ('table_name', 'status', 'rows_loaded', 'start_time', 'end_time', 'message')
+        new_events = [(event_id, event) for event_id, event in pending if event['db_id'] is None]
+        changed_events = [(event_id, event) for event_id, event in pending if event['db_id'] is not None]
+
+        try:
+            ensure_schema(conn)
+            with conn.cursor() as cur:
+                db_ids = []
+                if new_events:
+                    # RETURNING возвращает идентификаторы в порядке строк VALUES
+                    db_ids = execute_values(cur, """
+                        INSERT INTO LOGS.etl_logs (table_name, status, rows_loaded, start_time, end_time,
+                                                   message, run_id)
+                        VALUES %s
+                        RETURNING id;
+                    """, [tuple(event[c] for c in columns) + (self.run_id,) for _, event in new_events],
+                        fetch=True)
+                if changed_events:
+                    execute_values(cur, """
+                        UPDATE LOGS.etl_logs l
+                        SET status = v.status,
+                            rows_loaded = v.rows_loaded,
+                            end_time = v.end_time,
+                            message = v.message
+                        FROM (VALUES %s) AS v(id, status, rows_loaded, end_time, message)
+                        WHERE l.id = v.id;
+                    """, [(event['db_id'], event['status'], event['rows_loaded'], event['end_time'],
+                           event['message']) for _, event in changed_events],
+                        template="(%s, %s, %s::INTEGER, %s::TIMESTAMP, %s)")
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"⚠️ Ошибка записи логов (события останутся в буфере): {e}")
+            return 0
+
+        with self._lock:
+            for (event_id, event), (db_id,) in zip(new_events, db_ids):
+                self._events[event_id]['db_id'] = db_id
+            for event_id, event in pending:
+                # Событие могло измениться во время записи - тогда оно останется к записи
+                current = self._events[event_id]
+                if current['status'] == event['status'] and current['end_time'] == event['end_time']:
+                    current['dirty'] = False
+                    # Завершенные и записанные события больше не нужны в памяти
+                    if current['end_time'] is not None:
+                        del self._events[event_id]
+        return len(pending)
@@ -0,0 +1,346 @@
+"""
+Версионированные миграции схемы: первичные ключи, индексы, помесячное секционирование таблиц DS и DM
+и вычисляемый счет второго порядка в DS.MD_ACCOUNT_D.
+    python migrations.py              # применить новые миграции
+    python migrations.py --reapply    # применить все миграции заново (например, после clear_dm.py)
+    python migrations.py --report     # замеры процедур до и после миграций на временной копии базы
+
+Примененные версии записываются в LOGS.schema_migrations. Каждая миграция идемпотентна,
+а ее отмена (down) используется только в отчете - на временной копии базы (CREATE DATABASE ... TEMPLATE),
+рабочая база отчетом не меняется. Для копии к базе не должно быть других подключений.
+Миграции выполняются после создания таблиц (create_tables.py, create_dm_procedures.py, create_f101_table.py).
+"""
+import argparse
+import time
+from contextlib import contextmanager
+from datetime import date
+import psycopg2
+from config import DB_CONFIG, SESSION_SETTINGS
+from db import analyze_tables, connect, get_connection
+
+create_migrations_sql = """
+CREATE SCHEMA IF NOT EXISTS LOGS;
+
+CREATE TABLE IF NOT EXISTS LOGS.schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT now(),
+    duration_ms NUMERIC(12,1)
+);
+"""
+
+# Ключ витрин (дата, счет): DELETE за дату и соединения по счету и дате идут по индексу
+dm_primary_keys_sql = """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conrelid = 'DM.DM_ACCOUNT_TURNOVER_F'::regclass AND contype = 'p') THEN
+                ALTER TABLE DM.DM_ACCOUNT_TURNOVER_F
+                    ADD CONSTRAINT dm_account_turnover_f_pkey PRIMARY KEY (on_date, account_rk);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conrelid = 'DM.DM_ACCOUNT_BALANCE_F'::regclass AND contype = 'p') THEN
+                ALTER TABLE DM.DM_ACCOUNT_BALANCE_F
+                    ADD CONSTRAINT dm_account_balance_f_pkey PRIMARY KEY (on_date, account_rk);
+            END IF;
+        END $$;
+"""
+
+# Проводки читаются по диапазону дат операции: покрывающий индекс содержит все колонки расчета оборотов;
+# индексы по счету (кредит или дебет) - для проводок счета за период
+posting_indexes_sql = """
+        CREATE INDEX IF NOT EXISTS ft_posting_f_oper_date_idx ON DS.FT_POSTING_F (oper_date)
+            INCLUDE (credit_account_rk, debet_account_rk, credit_amount, debet_amount);
+        CREATE INDEX IF NOT EXISTS ft_posting_f_credit_account_idx ON DS.FT_POSTING_F (credit_account_rk, oper_date);
+        CREATE INDEX IF NOT EXISTS ft_posting_f_debet_account_idx ON DS.FT_POSTING_F (debet_account_rk, oper_date);
+"""
+
+def partition_table_sql(table, column):
+    """Функция для SQL перевода таблицы в секционированную по месяцам column: таблица переименовывается,
+    создается секционированная с теми же колонками и секциями под имеющиеся месяцы, строки копируются,
+    триггеры переносятся, прежняя таблица удаляется. Уже секционированная таблица не меняется"""
+    schema, name = table.lower().split('.')
+    return f"""
+        DO $$
+        DECLARE
+            v_month DATE;
+            v_trigger TEXT;
+            v_triggers TEXT[];
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = '{table}'::regclass) THEN
+                RETURN;
+            END IF;
+            SELECT array_agg(pg_get_triggerdef(oid)) INTO v_triggers
+            FROM pg_trigger WHERE tgrelid = '{table}'::regclass AND NOT tgisinternal;
+
+            ALTER TABLE {table} RENAME TO {name}_unpartitioned;
+            CREATE TABLE {table} (LIKE {schema}.{name}_unpartitioned INCLUDING DEFAULTS)
+                PARTITION BY RANGE ({column});
+            FOR v_month IN
+                SELECT DISTINCT date_trunc('month', {column})::DATE FROM {schema}.{name}_unpartitioned
+            LOOP
+                EXECUTE format('CREATE TABLE {schema}.%I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                               '{name}_' || to_char(v_month, 'YYYY_MM'), v_month,
+                               (v_month + INTERVAL '1 month')::DATE);
+            END LOOP;
+            INSERT INTO {table} SELECT * FROM {schema}.{name}_unpartitioned;
+            DROP TABLE {schema}.{name}_unpartitioned;
+
+            -- Триггеры - после копирования, чтобы перенос строк не отмечал даты проводок как измененные
+            FOREACH v_trigger IN ARRAY COALESCE(v_triggers, '{{}}'::TEXT[]) LOOP
+                EXECUTE v_trigger;
+            END LOOP;
+        END $$;
+    """
+
+def unpartition_table_sql(table):
+    """Функция для SQL обратного перевода секционированной таблицы в обычную (для отчета о миграциях)"""
+    schema, name = table.lower().split('.')
+    return f"""
+        DO $$
+        DECLARE
+            v_trigger TEXT;
+            v_triggers TEXT[];
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = '{table}'::regclass) THEN
+                RETURN;
+            END IF;
+            SELECT array_agg(pg_get_triggerdef(oid)) INTO v_triggers
+            FROM pg_trigger WHERE tgrelid = '{table}'::regclass AND NOT tgisinternal;
+
+            ALTER TABLE {table} RENAME TO {name}_partitioned;
+            CREATE TABLE {table} (LIKE {schema}.{name}_partitioned INCLUDING DEFAULTS);
+            INSERT INTO {table} SELECT * FROM {schema}.{name}_partitioned;
+            DROP TABLE {schema}.{name}_partitioned;
+
+            FOREACH v_trigger IN ARRAY COALESCE(v_triggers, '{{}}'::TEXT[]) LOOP
+                EXECUTE v_trigger;
+            END LOOP;
+        END $$;
+    """
+
+# Таблицы, секционированные по месяцам: (таблица, колонка даты)
+PARTITIONED_TABLES = [
+    ('DS.FT_POSTING_F', 'oper_date'),
+    ('DM.DM_ACCOUNT_TURNOVER_F', 'on_date'),
+    ('DM.DM_ACCOUNT_BALANCE_F', 'on_date'),
+]
+
+# Миграции: (версия, название, применение, отмена)
+MIGRATIONS = [
+    (1, 'dm_primary_keys', dm_primary_keys_sql, """
+        ALTER TABLE DM.DM_ACCOUNT_TURNOVER_F DROP CONSTRAINT IF EXISTS dm_account_turnover_f_pkey;
+        ALTER TABLE DM.DM_ACCOUNT_BALANCE_F DROP CONSTRAINT IF EXISTS dm_account_balance_f_pkey;
+    """),
+    (2, 'posting_indexes', posting_indexes_sql, """
+        DROP INDEX IF EXISTS DS.ft_posting_f_oper_date_idx;
+        DROP INDEX IF EXISTS DS.ft_posting_f_credit_account_idx;
+        DROP INDEX IF EXISTS DS.ft_posting_f_debet_account_idx;
+    """),
+    (3, 'dimension_indexes', """
+        -- Счет, действующий на дату: поиск по account_rk и интервалу действия, валюта и тип - из индекса
+        CREATE INDEX IF NOT EXISTS md_account_d_account_dates_idx
+            ON DS.MD_ACCOUNT_D (account_rk, data_actual_date, data_actual_end_date)
+            INCLUDE (currency_rk, char_type);
+        -- Курс валюты на дату (первичный ключ начинается с даты)
+        CREATE INDEX IF NOT EXISTS md_exchange_rate_d_currency_date_idx
+            ON DS.MD_EXCHANGE_RATE_D (currency_rk, data_actual_date)
+            INCLUDE (reduced_cource);
+    """, """
+        DROP INDEX IF EXISTS DS.md_account_d_account_dates_idx;
+        DROP INDEX IF EXISTS DS.md_exchange_rate_d_currency_date_idx;
+    """),
+    (4, 'f101_period_index', """
+        -- Очистка и чтение формы 101 за отчетный период
+        CREATE INDEX IF NOT EXISTS dm_f101_round_f_period_idx ON DM.DM_F101_ROUND_F (from_date, to_date);
+    """, """
+        DROP INDEX IF EXISTS DM.dm_f101_round_f_period_idx;
+    """),
+    (5, 'monthly_partitioning',
+     # Ключи и индексы прежних таблиц удаляются вместе с ними и создаются заново на секционированных
+     ''.join(partition_table_sql(table, column) for table, column in PARTITIONED_TABLES)
+     + dm_primary_keys_sql + posting_indexes_sql,
+     ''.join(unpartition_table_sql(table) for table, _ in PARTITIONED_TABLES)),
+    (6, 'account_ledger_column', """
+        -- Счет второго порядка вычисляется один раз при записи счета, форма 101 соединяется с ним по равенству
+        ALTER TABLE DS.MD_ACCOUNT_D ADD COLUMN IF NOT EXISTS ledger_account INTEGER
+            GENERATED ALWAYS AS (LEFT(account_number, 5)::integer) STORED;
+        CREATE INDEX IF NOT EXISTS md_account_d_ledger_account_idx
+            ON DS.MD_ACCOUNT_D (ledger_account, data_actual_date, data_actual_end_date);
+    """, """
+        -- Колонку использует процедура формы 101, поэтому в отчете отменяется только индекс
+        DROP INDEX IF EXISTS DS.md_account_d_ledger_account_idx;
+    """),
+]
+
+# Таблицы, статистика которых обновляется после миграций (отсутствующие пропускаются:
+# DM.DM_F101_ROUND_F создается отдельно, create_f101_table.py)
+ANALYZE_TABLES = [
+    'DS.FT_POSTING_F',
+    'DS.MD_ACCOUNT_D',
+    'DS.MD_EXCHANGE_RATE_D',
+    'DM.DM_ACCOUNT_TURNOVER_F',
+    'DM.DM_ACCOUNT_BALANCE_F',
+    'DM.DM_F101_ROUND_F',
+]
+
+# Замеры для отчета: процедуры расчета витрин за январь 2018 года и очистка витрины за дату
+BENCHMARKS = [
+    ('Обороты за день', "SELECT ds.fill_account_turnover_f(%(on_date)s)"),
+    ('Обороты за месяц', "SELECT ds.fill_account_turnover_range_f(%(date_from)s, %(date_to)s)"),
+    ('Остатки за день', "SELECT ds.fill_account_balance_f(%(on_date)s)"),
+    ('Остатки за месяц', "SELECT ds.fill_account_balance_range_f(%(date_from)s, %(date_to)s)"),
+    ('Форма 101 за месяц', "SELECT dm.fill_f101_round_f(%(report_date)s)"),
+    ('Удаление остатков за день', "DELETE FROM DM.DM_ACCOUNT_BALANCE_F WHERE on_date = %(on_date)s"),
+]
+
+BENCHMARK_PARAMS = {
+    'on_date': date(2018, 1, 15),
+    'date_from': date(2018, 1, 1),
+    'date_to': date(2018, 1, 31),
+    'report_date': date(2018, 2, 1),
+}
+
+# Временная копия рабочей базы для отчета о миграциях
+SCRATCH_DATABASE = f"{DB_CONFIG['database']}_migrations_report"
+
+def ensure_migrations_table(conn):
+    """Функция для создания таблицы примененных миграций"""
+    with conn.cursor() as cur:
+        cur.execute(create_migrations_sql)
+    conn.commit()
+
+def applied_versions(conn):
+    """Функция для множества примененных версий"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM LOGS.schema_migrations")
+        return {row[0] for row in cur.fetchall()}
+
+def existing_tables(conn, tables):
+    """Функция для списка таблиц из tables, которые есть в базе"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT t FROM unnest(%s::TEXT[]) t WHERE to_regclass(t) IS NOT NULL", (list(tables),))
+        return [row[0] for row in cur.fetchall()]
+
+def apply_migrations(reapply=False):
+    """Функция для применения миграций по порядку версий, каждая - в своей транзакции.
+    reapply=True - применить и уже примененные (миграции идемпотентны).
+    При ошибке следующие миграции не применяются. Возвращает список примененных версий"""
+    done = []
+    with get_connection() as conn:
+        ensure_migrations_table(conn)
+        applied = applied_versions(conn)
+        for version, name, up_sql, _ in MIGRATIONS:
+            if version in applied and not reapply:
+                continue
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(up_sql)
+                    cur.execute("""
+                        INSERT INTO LOGS.schema_migrations (version, name, applied_at, duration_ms)
+                        VALUES (%s, %s, now(), %s)
+                        ON CONFLICT (version) DO UPDATE
+                        SET name = EXCLUDED.name,
+                            applied_at = EXCLUDED.applied_at,
+                            duration_ms = EXCLUDED.duration_ms;
+                    """, (version, name, round((time.perf_counter() - start) * 1000, 1)))
+                conn.commit()
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"❌ Миграция {version} ({name}) не применена: {e}")
+                break
+            done.append(version)
+            print(f"✅ Миграция {version} ({name}) применена за {time.perf_counter() - start:.2f} с")
+
+        if done:
+            analyze_tables(conn, existing_tables(conn, ANALYZE_TABLES))
+        else:
+            print("Новых миграций нет.")
+    return done
+
+@contextmanager
+def scratch_database():
+    """Функция для временной копии рабочей базы (CREATE DATABASE ... TEMPLATE): выдает соединение
+    с копией, по выходу копия удаляется. Отчет отменяет и применяет миграции только в копии"""
+    admin = connect(database='postgres')
+    admin.autocommit = True
+    conn = None
+    try:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DATABASE};")
+            cur.execute(f"CREATE DATABASE {SCRATCH_DATABASE} TEMPLATE {DB_CONFIG['database']};")
+        conn = connect(database=SCRATCH_DATABASE)
+        with conn.cursor() as cur:
+            for name, value in SESSION_SETTINGS['dm'].items():
+                cur.execute("SELECT set_config(%s, %s, false);", (name, str(value)))
+        conn.commit()
+        yield conn
+    finally:
+        if conn is not None:
+            conn.close()
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DATABASE};")
+        admin.close()
+
+def migrate_scratch(conn, down=False):
+    """Функция для отмены (down=True) или применения всех миграций в копии базы одной транзакцией
+    с обновлением статистики; LOGS.schema_migrations не меняется"""
+    with conn.cursor() as cur:
+        if down:
+            for _, _, _, down_sql in reversed(MIGRATIONS):
+                cur.execute(down_sql)
+        else:
+            for _, _, up_sql, _ in MIGRATIONS:
+                cur.execute(up_sql)
+    conn.commit()
+    analyze_tables(conn, existing_tables(conn, ANALYZE_TABLES))
+
+def measure(conn, runs=3):
+    """Функция для замера BENCHMARKS: лучшее время из runs запусков (в мс) после прогревочного.
+    Каждый запуск выполняется в транзакции, которая откатывается"""
+    timings = {}
+    with conn.cursor() as cur:
+        for name, sql in BENCHMARKS:
+            results = []
+            for _ in range(runs + 1):
+                start = time.perf_counter()
+                cur.execute(sql, BENCHMARK_PARAMS)
+                results.append((time.perf_counter() - start) * 1000)
+                conn.rollback()
+            timings[name] = min(results[1:])
+    return timings
+
+def report(runs=3):
+    """Функция для отчета о времени процедур до и после миграций на временной копии базы:
+    в копии миграции отменяются, выполняются замеры, миграции применяются и замеры повторяются"""
+    with scratch_database() as conn:
+        migrate_scratch(conn, down=True)
+        before = measure(conn, runs)
+        migrate_scratch(conn)
+        after = measure(conn, runs)
+
+    print("=" * 70)
+    print(f"{'Операция':<30}{'до миграций, мс':>18}{'после, мс':>18}{'ускорение':>12}")
+    print("-" * 70)
+    for name, _ in BENCHMARKS:
+        print(f"{name:<30}{before[name]:>18.1f}{after[name]:>18.1f}{before[name] / after[name]:>11.2f}x")
+    print("=" * 70)
+    return before, after
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы: ключи, индексы и секционирование таблиц DS и DM")
+    parser.add_argument('--reapply', action='store_true', help="применить все миграции заново")
+    parser.add_argument('--report', action='store_true', help="замеры процедур до и после миграций на временной копии базы")
+    parser.add_argument('--runs', type=int, default=3, help="число замеров каждой операции в отчете")
+    args = parser.parse_args()
+    try:
+        if args.report:
+            report(args.runs)
+        else:
+            apply_migrations(args.reapply)
+    except Exception as e:
+        print(f"Ошибка миграций: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,15 @@
 """
 Очистка и пересоздание базы данных bankdb
 """
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import connect
 
 def clear_database():
     try:
-        # Подключаемся к postgres (системная БД)
-        postgres_config = DB_CONFIG.copy()
-        postgres_config['database'] = 'postgres'  # Меняем на системную БД
-        
-        conn = psycopg2.connect(**postgres_config)
+        # Подключаемся к postgres (системная БД), вне общего пула
+        conn = connect(database='postgres')
         conn.autocommit = True
         cur = conn.cursor()
         
@@ -1,5 +1,7 @@
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
 create_schema_sql = """
 CREATE SCHEMA IF NOT EXISTS DS;
@@ -14,7 +16,8 @@ CREATE TABLE IF NOT EXISTS LOGS.etl_logs (
     rows_loaded INT,
     start_time TIMESTAMP,
     end_time TIMESTAMP,
-    message TEXT
+    message TEXT,
+    run_id VARCHAR(32)
 );
 
 CREATE TABLE IF NOT EXISTS DS.FT_BALANCE_F (
@@ -31,7 +34,7 @@ CREATE TABLE IF NOT EXISTS DS.FT_POSTING_F (
     debet_account_rk INTEGER NOT NULL,
     credit_amount FLOAT,
     debet_amount FLOAT
-);
+) PARTITION BY RANGE (oper_date);  -- секции DS.FT_POSTING_F_ГГГГ_ММ создает загрузчик
 
 CREATE TABLE IF NOT EXISTS DS.MD_ACCOUNT_D (
     data_actual_date DATE NOT NULL,
@@ -41,6 +44,7 @@ CREATE TABLE IF NOT EXISTS DS.MD_ACCOUNT_D (
     char_type VARCHAR(1) NOT NULL,
     currency_rk INTEGER NOT NULL,
     currency_code VARCHAR(3) NOT NULL,
+    ledger_account INTEGER GENERATED ALWAYS AS (LEFT(account_number, 5)::integer) STORED,  -- счет второго порядка
     PRIMARY KEY (data_actual_date, account_rk)
 );
 
@@ -97,27 +101,19 @@ CREATE TABLE IF NOT EXISTS DS.MD_LEDGER_ACCOUNT_S (
 
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Creating schemas...")
-        cur.execute(create_schema_sql)
-        
-        print("Creating tables...")
-        cur.execute(create_tables_sql)
-        
-        conn.commit()
-        print("Schemas and tables created successfully.")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Creating schemas...")
+                cur.execute(create_schema_sql)
+                
+                print("Creating tables...")
+                cur.execute(create_tables_sql)
+            
+            conn.commit()
+            print("Schemas and tables created successfully.")
         
     except Exception as e:
         print(f"Error: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
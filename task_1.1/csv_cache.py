@@ -0,0 +1,149 @@
+"""
+Кэш разобранных CSV-файлов в бинарном колоночном формате (NumPy .npy).
+Каждая колонка хранится отдельным файлом и при чтении отображается в память (mmap),
+поэтому повторный запуск загрузки не разбирает неизменившиеся файлы заново. Числовые колонки и даты
+остаются представлениями отображенных файлов (без копирования, только для чтения), текстовые
+собираются в объекты Python.
+"""
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.csv_cache')
+
+# Максимальный суммарный размер кэша; при превышении удаляются давно не использованные записи
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Версия формата кэша: при изменении разбора CSV старые записи перестают совпадать по ключу
+CACHE_VERSION = 1
+
+# Уже вычисленные хэши файлов по (путь, размер, время изменения) - чтобы не читать файл дважды за запуск
+FINGERPRINT_CACHE = {}
+
+def file_fingerprint(file_path):
+    """Функция для вычисления SHA-256 содержимого файла"""
+    stat = os.stat(file_path)
+    fingerprint_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if fingerprint_key in FINGERPRINT_CACHE:
+        return FINGERPRINT_CACHE[fingerprint_key]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    FINGERPRINT_CACHE[fingerprint_key] = digest.hexdigest()
+    return FINGERPRINT_CACHE[fingerprint_key]
+
+def cache_key(file_path, parse_options=None):
+    """Функция для вычисления ключа кэша: путь, размер, время изменения и хэш содержимого файла,
+    а также параметры разбора (колонки и форматы дат)"""
+    stat = os.stat(file_path)
+    key_source = json.dumps([
+        CACHE_VERSION,
+        os.path.abspath(file_path),
+        stat.st_size,
+        stat.st_mtime_ns,
+        file_fingerprint(file_path),
+        parse_options,
+    ], sort_keys=True, default=str)
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+def _column_to_arrays(series):
+    """Функция для преобразования колонки в массивы NumPy: (тип, значения, маска пропусков)"""
+    values = series.to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime', values.astype('datetime64[ns]'), None
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series) \
+            or pd.api.types.is_float_dtype(series):
+        return 'numeric', values, None
+
+    # Текстовые колонки (object с None): фиксированная ширина 'U' + маска пропусков
+    mask = series.isna().to_numpy()
+    present = values[~mask]
+    if not all(isinstance(value, str) for value in present):
+        return None, None, None
+    text = np.where(mask, '', values).astype(str)
+    return 'str', text, mask
+
+def save_frame(key, df):
+    """Функция для сохранения DataFrame в кэш. Возвращает False, если колонки нельзя сохранить"""
+    entry_dir = os.path.join(CACHE_DIR, key)
+    tmp_dir = entry_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    meta = {'columns': [], 'rows': len(df)}
+    try:
+        for i, col in enumerate(df.columns):
+            kind, values, mask = _column_to_arrays(df[col])
+            if kind is None:
+                return False
+            np.save(os.path.join(tmp_dir, f'{i}.npy'), values, allow_pickle=False)
+            if mask is not None:
+                np.save(os.path.join(tmp_dir, f'{i}.mask.npy'), mask, allow_pickle=False)
+            meta['columns'].append({'name': col, 'kind': kind, 'masked': mask is not None})
+
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        # Запись появляется в кэше целиком или не появляется вовсе
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def load_frame(key):
+    """Функция для чтения DataFrame из кэша: числовые колонки и даты - представления файлов, отображенных
+    в память (copy=False - без копирования и объединения в общий блок), текстовые - массивы объектов.
+    None - если записи нет"""
+    entry_dir = os.path.join(CACHE_DIR, key)
+    meta_path = os.path.join(entry_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        values = np.load(os.path.join(entry_dir, f'{i}.npy'), mmap_mode='r', allow_pickle=False)
+        if column['kind'] == 'str':
+            mask = np.load(os.path.join(entry_dir, f'{i}.mask.npy'), mmap_mode='r', allow_pickle=False)
+            text = values.astype(object)
+            text[mask] = None
+            data[column['name']] = text
+        else:
+            data[column['name']] = values
+
+    # Отмечаем использование записи для вытеснения давно не использованных
+    os.utime(meta_path)
+    return pd.DataFrame(data, columns=[column['name'] for column in meta['columns']], copy=False)
+
+def _entry_size(entry_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """Функция для вытеснения давно не использованных записей, пока размер кэша больше max_bytes"""
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        meta_path = os.path.join(entry.path, 'meta.json')
+        if entry.is_dir() and os.path.exists(meta_path):
+            entries.append((os.path.getmtime(meta_path), _entry_size(entry.path), entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
@@ -1,94 +1,144 @@
+import codecs
+import io
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_values
 from datetime import datetime
-from config import DB_CONFIG
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config import DB_CONFIG, TABLE_KEYS
+from db import analyze_tables, ensure_month_partitions, get_connection, print_pool_stats
+from etl_log import EtlLogger, ensure_schema
+import csv_cache
 
-def connect_db():
-    """Функция создания и возвращения соединения"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        print(f"✅ Успешное подключение к базе данных {DB_CONFIG['database']} на {DB_CONFIG['host']}:{DB_CONFIG['port']}")
-        return conn
-    except psycopg2.Error as e:
-        print(f"❌ Ошибка при подключении к базе данных: {e}")
-        return None
+# Количество строк DataFrame, сериализуемых в CSV за один шаг при COPY
+COPY_BATCH_ROWS = 10000
 
-def log_start(conn, table_name):
-    """Функция для вставки записи о старте загрузки в таблицу логов"""
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS LOGS.etl_logs (
-                    id SERIAL PRIMARY KEY,
-                    table_name VARCHAR(100),
-                    status VARCHAR(20),
-                    start_time TIMESTAMP,
-                    end_time TIMESTAMP,
-                    rows_loaded INTEGER,
-                    message TEXT
-                );
-            """)
-            cur.execute("""
-                INSERT INTO LOGS.etl_logs (table_name, status, start_time)
-                VALUES (%s, %s, NOW())
-                RETURNING id;
-            """, (table_name, 'STARTED'))
-            log_id = cur.fetchone()[0]
-            conn.commit()
-            print(f"📝 Лог {log_id}: загрузка для {table_name} начата.")
-            return log_id
-    except Exception as e:
-        print(f"⚠️ Ошибка создания лога: {e}")
-        return None
+# Размер порции и длина очереди между чтением и загрузкой в потоковом режиме
+STREAM_CHUNK_ROWS = 50000
+STREAM_QUEUE_SIZE = 2
+
+# Объем выборки (в байтах) для определения кодировки и кэш результатов по файлам
+ENCODING_SAMPLE_BYTES = 64 * 1024
+ENCODING_CACHE = {}
+
+# Состояние инкрементальной загрузки проводок: число строк и хэш содержимого по каждой дате
+create_posting_state_sql = """
+CREATE TABLE IF NOT EXISTS LOGS.posting_load_state (
+    oper_date DATE PRIMARY KEY,
+    row_count INTEGER NOT NULL,
+    content_hash VARCHAR(16) NOT NULL,
+    loaded_at TIMESTAMP NOT NULL
+);
+"""
 
-def log_end(conn, log_id, record_count, status='SUCCESS'):
-    """Функция для вставки записи об окончании загрузки"""
-    if log_id is None:
-        return
+# Манифест загрузок: отпечаток исходного файла и число строк после последней успешной загрузки
+create_manifest_sql = """
+CREATE TABLE IF NOT EXISTS LOGS.load_manifest (
+    table_name VARCHAR(100) PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    file_size BIGINT NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    row_count INTEGER NOT NULL,
+    loaded_at TIMESTAMP NOT NULL
+);
+"""
+
+# Число таблиц, загружаемых параллельно (каждая в своем соединении)
+LOAD_WORKERS = 4
+
+_manifest_ready = False
+_manifest_lock = threading.Lock()
+
+def process_dates_and_nulls(df, date_columns=None, date_formats=None, verbose=True):
+    """Функция для приведения колонок к нижнему регистру, преобразования дат и замены NaN на None"""
+    df.columns = df.columns.str.lower()
+
+    # Обработка дат с правильными форматами
+    if date_columns and date_formats:
+        for col in date_columns:
+            if col in df.columns and col in date_formats:
+                if verbose:
+                    print(f"📅 Обрабатываем даты в {col}")
+                df[col] = pd.to_datetime(df[col], format=date_formats[col], errors='coerce')
+                df[col] = df[col].where(pd.notna(df[col]), None)
+
+    # Обработка NaN значений
+    return df.where(pd.notna(df), None)
+
+def detect_encoding(file_path, sample_size=ENCODING_SAMPLE_BYTES):
+    """Функция для определения кодировки файла по первым sample_size байтам.
+    Результат кэшируется по (путь, размер, время изменения) файла"""
+    stat = os.stat(file_path)
+    cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if sample_size is not None and cache_key in ENCODING_CACHE:
+        return ENCODING_CACHE[cache_key]
+
+    with open(file_path, 'rb') as f:
+        sample = f.read(-1 if sample_size is None else sample_size)
+    is_whole_file = sample_size is None or len(sample) < sample_size
+
+    # Неполный многобайтовый символ в конце выборки не считается ошибкой UTF-8
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE LOGS.etl_logs
-                SET status = %s,
-                    rows_loaded = %s,
-                    end_time = NOW(),
-                    message = %s
-                WHERE id = %s;
-            """, (status, record_count, f"Загружено {record_count} записей", log_id))
-            conn.commit()
-            print(f"📝 Лог {log_id}: загрузка завершена ({status}), {record_count} записей.")
-    except Exception as e:
-        print(f"⚠️ Ошибка обновления лога: {e}")
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=is_whole_file)
+        encoding = 'utf-8'
+    except UnicodeDecodeError:
+        # cp1251 раньше latin1: latin1 "читает" кириллицу без ошибок, но с кракозябрами
+        try:
+            sample.decode('cp1251')
+            encoding = 'cp1251'
+        except UnicodeDecodeError:
+            encoding = 'latin1'
+
+    ENCODING_CACHE[cache_key] = encoding
+    return encoding
 
 def read_csv_with_encoding(file_path, date_columns=None, date_formats=None):
     """Функция для чтения CSV с автоопределением кодировки и обработкой дат"""
-    encodings = ['utf-8', 'latin1', 'cp1251']
-    
-    for encoding in encodings:
+    try:
+        encoding = detect_encoding(file_path)
         try:
             df = pd.read_csv(file_path, sep=';', encoding=encoding)
-            df.columns = df.columns.str.lower()
-            print(f"✅ Файл {file_path} прочитан ({encoding}): {len(df)} записей")
-            
-            # Обработка дат с правильными форматами
-            if date_columns and date_formats:
-                for col in date_columns:
-                    if col in df.columns and col in date_formats:
-                        print(f"📅 Обрабатываем даты в {col}")
-                        df[col] = pd.to_datetime(df[col], format=date_formats[col], errors='coerce')
-                        df[col] = df[col].where(pd.notna(df[col]), None)
-            
-            # Обработка NaN значений
-            df = df.where(pd.notna(df), None)
-            
-            return df
-            
-        except Exception as e:
-            continue
-    
-    print(f"❌ Ошибка: не удалось прочитать файл {file_path}")
-    return None
+        except UnicodeDecodeError:
+            # Выборка не показала проблемный участок - определяем кодировку по всему файлу
+            encoding = detect_encoding(file_path, sample_size=None)
+            df = pd.read_csv(file_path, sep=';', encoding=encoding)
+    except Exception as e:
+        print(f"❌ Ошибка: не удалось прочитать файл {file_path}: {e}")
+        return None
+
+    print(f"✅ Файл {file_path} прочитан ({encoding}): {len(df)} записей")
+    return process_dates_and_nulls(df, date_columns, date_formats)
+
+def read_csv_cached(config, use_cache=True):
+    """Функция для чтения CSV через кэш разобранных колонок: неизменившийся файл не разбирается заново"""
+    if not use_cache:
+        return read_csv_with_encoding(config['csv_file'], config['date_columns'], config['date_formats'])
+
+    parse_options = {'date_columns': config['date_columns'], 'date_formats': config['date_formats']}
+    key = csv_cache.cache_key(config['csv_file'], parse_options)
+    df = csv_cache.load_frame(key)
+    if df is not None:
+        print(f"⚡ Файл {config['csv_file']} взят из кэша: {len(df)} записей")
+        return df
+
+    df = read_csv_with_encoding(config['csv_file'], config['date_columns'], config['date_formats'])
+    if df is not None and csv_cache.save_frame(key, df):
+        csv_cache.evict()
+    return df
+
+def read_csv_chunks(file_path, date_columns=None, date_formats=None, chunksize=STREAM_CHUNK_ROWS):
+    """Генератор для чтения CSV порциями фиксированного размера с обработкой дат"""
+    encoding = detect_encoding(file_path)
+    print(f"✅ Файл {file_path} читается порциями по {chunksize} записей ({encoding})")
+    with pd.read_csv(file_path, sep=';', encoding=encoding, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield process_dates_and_nulls(chunk, date_columns, date_formats, verbose=False)
 
 def clean_currency_data(df):
     """Специальная обработка для таблицы валют"""
@@ -102,12 +152,74 @@ def clean_currency_data(df):
     
     return df
 
-def load_data(conn, df, table_name, key_columns=None):
-    """Функция для загрузки данных в целевую таблицу"""
-    if df is None or df.empty:
-        print(f"⚠️ Нет данных для загрузки в {table_name}")
-        return 0
+class DataFrameCopyStream:
+    """Файлоподобный объект для COPY: отдает DataFrame в виде CSV порциями по batch_rows строк"""
+
+    def __init__(self, df, batch_rows=COPY_BATCH_ROWS):
+        self.df = df
+        self.batch_rows = batch_rows
+        self.position = 0
+        self.buffer = io.StringIO()
+
+    def _next_batch(self):
+        batch = self.df.iloc[self.position:self.position + self.batch_rows]
+        self.position += self.batch_rows
+        self.buffer = io.StringIO(
+            batch.to_csv(sep=';', header=False, index=False, na_rep='\\N', date_format='%Y-%m-%d')
+        )
+
+    def read(self, size=-1):
+        data = self.buffer.read(size)
+        while (size < 0 or len(data) < size) and self.position < len(self.df):
+            self._next_batch()
+            data += self.buffer.read(size - len(data) if size >= 0 else -1)
+        return data
+
+
+def get_integer_columns(cur, table_name):
+    """Функция для получения целочисленных колонок целевой таблицы"""
+    schema, table = table_name.lower().split('.')
+    cur.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s
+            AND data_type IN ('smallint', 'integer', 'bigint');
+    """, (schema, table))
+    return {row[0] for row in cur.fetchall()}
+
+
+def copy_rows(cur, df, table_name, integer_columns=None):
+    """Функция для потоковой загрузки DataFrame в таблицу через COPY ... FROM STDIN"""
+    # Колонки с пропусками pandas читает как float ("35.0"), а COPY не приводит их к INTEGER
+    if integer_columns is None:
+        integer_columns = get_integer_columns(cur, table_name)
+    for col in df.columns:
+        if col in integer_columns and not pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col]).astype('Int64')
+
+    copy_query = f"""
+        COPY {table_name} ({', '.join(df.columns)})
+        FROM STDIN WITH (FORMAT csv, DELIMITER ';', NULL '\\N');
+    """
+    cur.copy_expert(copy_query, DataFrameCopyStream(df))
+
 
+def insert_rows(cur, df, table_name):
+    """Функция для загрузки DataFrame в таблицу через execute_values"""
+    columns = list(df.columns)
+    df = df.astype(object).where(pd.notna(df), None)
+    values = [tuple(row) for row in df.to_numpy()]
+
+    insert_query = f"""
+        INSERT INTO {table_name} ({', '.join(columns)})
+        VALUES %s;
+    """
+    execute_values(cur, insert_query, values)
+
+
+def prepare_data(df, table_name, key_columns=None, seen_keys=None):
+    """Функция для подготовки данных к загрузке: очистка валют и удаление дубликатов.
+    seen_keys - множество уже загруженных ключей (для удаления дубликатов между порциями)"""
     # Специальная обработка для MD_CURRENCY_D
     if 'MD_CURRENCY_D' in table_name:
         df = clean_currency_data(df)
@@ -116,117 +228,595 @@ def load_data(conn, df, table_name, key_columns=None):
     if 'MD_EXCHANGE_RATE_D' in table_name and key_columns:
         before = len(df)
         df = df.drop_duplicates(subset=key_columns)
+        if seen_keys is not None:
+            keys = list(df[key_columns].itertuples(index=False, name=None))
+            df = df[[key not in seen_keys for key in keys]]
+            seen_keys.update(keys)
         if before != len(df):
             print(f"🔄 Удалено дубликатов: {before - len(df)}")
 
-    columns = list(df.columns)
-    values = [tuple(row) for row in df.to_numpy()]
+    return df
 
-    with conn.cursor() as cur:
-        # Очищаем таблицу
-        cur.execute(f"TRUNCATE TABLE {table_name};")
-        
-        # Загружаем данные
-        insert_query = f"""
-            INSERT INTO {table_name} ({', '.join(columns)})
-            VALUES %s;
-        """
-        execute_values(cur, insert_query, values)
+def ensure_partitions(conn, df, table_name, column, commit=True):
+    """Функция для создания месячных секций таблицы под даты порции df (до записи строк)"""
+    dates = pd.to_datetime(df[column]).dropna()
+    if dates.empty:
+        return 0
+    created = ensure_month_partitions(conn, table_name, dates.min().date(), dates.max().date(), commit)
+    if created:
+        print(f"🗂️ {table_name}: создано месячных секций: {created}")
+    return created
 
-    conn.commit()
+def load_data(conn, df, table_name, key_columns=None, method='copy'):
+    """Функция для загрузки данных в целевую таблицу (method: 'copy' или 'insert')"""
+    if df is None or df.empty:
+        print(f"⚠️ Нет данных для загрузки в {table_name}")
+        return 0
+
+    df = prepare_data(df, table_name, key_columns)
+
+    start = time.perf_counter()
+
+    if method == 'copy':
+        try:
+            with conn.cursor() as cur:
+                # Очищаем таблицу
+                cur.execute(f"TRUNCATE TABLE {table_name};")
+                # Загружаем данные потоком через COPY
+                copy_rows(cur, df.copy(), table_name)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"⚠️ COPY в {table_name} не удался ({e}), загружаем через INSERT")
+            method = 'insert'
+            start = time.perf_counter()
+
+    if method == 'insert':
+        with conn.cursor() as cur:
+            # Очищаем таблицу
+            cur.execute(f"TRUNCATE TABLE {table_name};")
+            # Загружаем данные
+            insert_rows(cur, df, table_name)
+        conn.commit()
+
+    elapsed = time.perf_counter() - start
+    rate = len(df) / elapsed if elapsed > 0 else 0
     print(f"✅ Данные в {table_name} загружены: {len(df)} записей")
+    print(f"⚡ {method.upper()}: {elapsed:.2f} с, {rate:,.0f} записей/с")
     return len(df)
 
-def load_all_tables():
-    """Загрузка всех таблиц"""
-    conn = connect_db()
-    if conn is None:
-        print("❌ Не удалось подключиться к базе данных. Завершаем.")
-        return
+def merge_data(conn, df, table_name, key_columns, method='copy'):
+    """Функция для загрузки данных в режиме UPSERT через временную staging-таблицу:
+    новые строки вставляются, изменившиеся обновляются, неизменные не переписываются, а строки,
+    которых больше нет в файле, удаляются - как и при TRUNCATE + загрузке, таблица совпадает с файлом.
+    Возвращает словарь с количеством вставленных, обновленных, неизменных и удаленных строк"""
+    if df is None or df.empty:
+        print(f"⚠️ Нет данных для загрузки в {table_name}")
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+    df = prepare_data(df, table_name, key_columns)
+
+    # ON CONFLICT не может обновить одну строку дважды, поэтому ключи в порции должны быть уникальны
+    before = len(df)
+    df = df.drop_duplicates(subset=key_columns)
+    if before != len(df):
+        print(f"🔄 Удалено дубликатов по ключу: {before - len(df)}")
+
+    columns = list(df.columns)
+    update_columns = [col for col in columns if col not in key_columns]
+    staging_table = 'stg_' + table_name.split('.')[-1].lower()
+
+    if update_columns:
+        conflict_action = f"""
+            DO UPDATE SET {', '.join(f'{col} = EXCLUDED.{col}' for col in update_columns)}
+            WHERE ({', '.join(f'target.{col}' for col in update_columns)})
+                IS DISTINCT FROM ({', '.join(f'EXCLUDED.{col}' for col in update_columns)})
+        """
+    else:
+        conflict_action = "DO NOTHING"
+
+    merge_query = f"""
+        WITH merged AS (
+            INSERT INTO {table_name} AS target ({', '.join(columns)})
+            SELECT {', '.join(columns)} FROM {staging_table}
+            ON CONFLICT ({', '.join(key_columns)}) {conflict_action}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+        FROM merged;
+    """
+
+    # Строки, удаленные из исходного файла (в той же транзакции, что и UPSERT)
+    delete_missing_query = f"""
+        DELETE FROM {table_name} AS target
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {staging_table} stg
+            WHERE {' AND '.join(f'stg.{col} = target.{col}' for col in key_columns)}
+        );
+    """
+
+    start = time.perf_counter()
 
-    # Создаем схему LOGS если не существует
     with conn.cursor() as cur:
-        cur.execute("CREATE SCHEMA IF NOT EXISTS LOGS;")
+        cur.execute(f"""
+            CREATE TEMP TABLE {staging_table} (LIKE {table_name} INCLUDING DEFAULTS)
+            ON COMMIT DROP;
+        """)
+        if method == 'copy':
+            copy_rows(cur, df.copy(), staging_table, get_integer_columns(cur, table_name))
+        else:
+            insert_rows(cur, df, staging_table)
+        cur.execute(merge_query)
+        inserted, updated = cur.fetchone()
+        cur.execute(delete_missing_query)
+        deleted = cur.rowcount
+
+    conn.commit()
+
+    counts = {'inserted': inserted, 'updated': updated, 'unchanged': len(df) - inserted - updated,
+              'deleted': deleted}
+    elapsed = time.perf_counter() - start
+    print(f"✅ {table_name} (UPSERT): вставлено {counts['inserted']}, обновлено {counts['updated']}, "
+          f"без изменений {counts['unchanged']}, удалено {counts['deleted']} за {elapsed:.2f} с")
+    return counts
+
+def ensure_manifest(conn):
+    """Функция для создания таблицы манифеста загрузок (один раз за процесс)"""
+    global _manifest_ready
+    with _manifest_lock:
+        if _manifest_ready:
+            return
+        with conn.cursor() as cur:
+            cur.execute(create_manifest_sql)
         conn.commit()
+        _manifest_ready = True
+
+def is_load_unchanged(conn, table_name, content_hash):
+    """Функция для проверки по манифесту: файл не менялся с последней успешной загрузки
+    и таблица содержит столько же строк, сколько было загружено"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT content_hash, row_count FROM LOGS.load_manifest WHERE table_name = %s;",
+                    (table_name,))
+        manifest = cur.fetchone()
+        if manifest is None or manifest[0] != content_hash:
+            conn.commit()
+            return False
+        cur.execute(f"SELECT COUNT(*) FROM {table_name};")
+        row_count = cur.fetchone()[0]
+    conn.commit()
+    return row_count == manifest[1]
+
+def update_manifest(conn, table_name, file_path, content_hash):
+    """Функция для записи в манифест отпечатка файла и числа строк после успешной загрузки"""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {table_name};")
+        row_count = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO LOGS.load_manifest (table_name, file_path, file_size, content_hash, row_count, loaded_at)
+            VALUES (%s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (table_name) DO UPDATE
+            SET file_path = EXCLUDED.file_path,
+                file_size = EXCLUDED.file_size,
+                content_hash = EXCLUDED.content_hash,
+                row_count = EXCLUDED.row_count,
+                loaded_at = EXCLUDED.loaded_at;
+        """, (table_name, file_path, os.path.getsize(file_path), content_hash, row_count))
+    conn.commit()
 
-    # Конфигурация всех таблиц
-    tables_config = [
-        {
-            'csv_file': 'csv_files/md_account_d.csv',
-            'table_name': 'DS.MD_ACCOUNT_D',
-            'date_columns': ['data_actual_date', 'data_actual_end_date'],
-            'date_formats': {'data_actual_date': '%Y-%m-%d', 'data_actual_end_date': '%Y-%m-%d'},
-            'key_columns': None
-        },
-        {
-            'csv_file': 'csv_files/md_currency_d.csv',
-            'table_name': 'DS.MD_CURRENCY_D',
-            'date_columns': ['data_actual_date', 'data_actual_end_date'],
-            'date_formats': {'data_actual_date': '%Y-%m-%d', 'data_actual_end_date': '%Y-%m-%d'},
-            'key_columns': None
-        },
-        {
-            'csv_file': 'csv_files/md_exchange_rate_d.csv',
-            'table_name': 'DS.MD_EXCHANGE_RATE_D',
-            'date_columns': ['data_actual_date', 'data_actual_end_date'],
-            'date_formats': {'data_actual_date': '%Y-%m-%d', 'data_actual_end_date': '%Y-%m-%d'},
-            'key_columns': ['data_actual_date', 'currency_rk']
-        },
-        {
-            'csv_file': 'csv_files/md_ledger_account_s.csv',
-            'table_name': 'DS.MD_LEDGER_ACCOUNT_S',
-            'date_columns': ['start_date', 'end_date'],
-            'date_formats': {'start_date': '%Y-%m-%d', 'end_date': '%Y-%m-%d'},
-            'key_columns': None
-        },
-        {
-            'csv_file': 'csv_files/ft_posting_f.csv',
-            'table_name': 'DS.FT_POSTING_F',
-            'date_columns': ['oper_date'],
-            'date_formats': {'oper_date': '%d-%m-%Y'},
-            'key_columns': None
-        },
-        {
-            'csv_file': 'csv_files/ft_balance_f.csv',
-            'table_name': 'DS.FT_BALANCE_F',
-            'date_columns': ['on_date'],
-            'date_formats': {'on_date': '%d.%m.%Y'},
-            'key_columns': ['on_date', 'account_rk']
+def refresh_rate_calendar(conn, date_from=None, date_to=None):
+    """Функция для обновления календаря курсов DM.DM_RATE_CALENDAR после загрузки курсов:
+    пересчитываются только уже заполненные даты календаря внутри [date_from, date_to]
+    (None - без ограничения). Если календаря в базе нет (слой DM не создан), ничего не делает.
+    Возвращает число пересчитанных дат"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regprocedure('ds.fill_rate_calendar_f(date, date)') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("SELECT MIN(on_date), MAX(on_date) FROM DM.DM_RATE_CALENDAR")
+        calendar_from, calendar_to = cur.fetchone()
+        if calendar_from is None:
+            return 0
+        date_from = max(date_from or calendar_from, calendar_from)
+        date_to = min(date_to or calendar_to, calendar_to)
+        if date_from > date_to:
+            return 0
+        cur.execute("SELECT ds.fill_rate_calendar_f(%s, %s)", (date_from, date_to))
+    conn.commit()
+    days = (date_to - date_from).days + 1
+    print(f"📅 Календарь курсов DM.DM_RATE_CALENDAR обновлен за {date_from} - {date_to} ({days} дн.)")
+    return days
+
+def reset_posting_state(conn):
+    """Функция для сброса состояния инкрементальной загрузки после полной перезагрузки проводок"""
+    with conn.cursor() as cur:
+        cur.execute(create_posting_state_sql)
+        cur.execute("TRUNCATE TABLE LOGS.posting_load_state;")
+    conn.commit()
+
+def begin_full_reload(conn, table_name):
+    """Функция для начала полной перезагрузки проводок: построчные отметки измененных дат для DM
+    (триггеры LOGS.dm_dirty_dates) в этом сеансе отключаются, вместо них в LOGS.dm_full_reloads
+    записывается одна строка - refresh_dm пересчитает по ней всю витрину. Строка фиксируется
+    до загрузки, поэтому остается и при ошибке; параметр сеанса сбрасывается при возврате соединения в пул"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT set_config('dm.full_reload', 'on', false);")
+        cur.execute("SELECT to_regclass('LOGS.dm_full_reloads') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("INSERT INTO LOGS.dm_full_reloads (table_name) VALUES (%s);", (table_name,))
+    conn.commit()
+
+def load_postings_incremental(conn, df, table_name='DS.FT_POSTING_F', date_column='oper_date'):
+    """Функция для инкрементальной загрузки проводок: для каждой даты операции в файле считается
+    число строк и хэш содержимого, перезагружаются только новые и изменившиеся даты; проводки дат,
+    которых больше нет в файле, удаляются (результат совпадает с полной перезагрузкой).
+    Возвращает множество затронутых дат (для пересчета витрин DM только по ним)"""
+    df = df[df[date_column].notna()]
+    if df.empty:
+        print(f"⚠️ Нет данных для загрузки в {table_name}")
+        return set()
+
+    start = time.perf_counter()
+
+    # Хэш даты - сумма хэшей строк, поэтому не зависит от порядка строк в файле
+    dates = pd.to_datetime(df[date_column]).dt.date
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    file_state = (
+        pd.DataFrame({'oper_date': dates.values, 'row_hash': row_hashes.values})
+        .groupby('oper_date')['row_hash']
+        .agg(row_count='size', content_hash=lambda h: f"{int(h.sum()):016x}")
+    )
+
+    with conn.cursor() as cur:
+        cur.execute(create_posting_state_sql)
+        cur.execute("SELECT oper_date, row_count, content_hash FROM LOGS.posting_load_state;")
+        loaded_state = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+        changed_dates = {
+            oper_date for oper_date, state in file_state.iterrows()
+            if loaded_state.get(oper_date) != (state['row_count'], state['content_hash'])
         }
-    ]
+        removed_dates = set(loaded_state) - set(file_state.index)
+        touched_dates = changed_dates | removed_dates
+
+        if touched_dates:
+            # Удаляем новые, изменившиеся и исчезнувшие из файла даты, загружаем заново первые два
+            cur.execute(
+                f"DELETE FROM {table_name} WHERE {date_column} = ANY(%s::date[]);",
+                (sorted(touched_dates),)
+            )
+            changed_rows = df[dates.isin(changed_dates).values]
+            copy_rows(cur, changed_rows.copy(), table_name)
+            if removed_dates:
+                cur.execute("DELETE FROM LOGS.posting_load_state WHERE oper_date = ANY(%s::date[]);",
+                            (sorted(removed_dates),))
+
+            execute_values(cur, """
+                INSERT INTO LOGS.posting_load_state (oper_date, row_count, content_hash, loaded_at)
+                VALUES %s
+                ON CONFLICT (oper_date) DO UPDATE
+                SET row_count = EXCLUDED.row_count,
+                    content_hash = EXCLUDED.content_hash,
+                    loaded_at = EXCLUDED.loaded_at;
+            """, [
+                (oper_date, int(file_state.at[oper_date, 'row_count']),
+                 file_state.at[oper_date, 'content_hash'], datetime.now())
+                for oper_date in sorted(changed_dates)
+            ])
+            record_count = len(changed_rows)
+        else:
+            record_count = 0
+
+    conn.commit()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {table_name}: перезагружено дат {len(changed_dates)} из {len(file_state)}, "
+          f"удалено дат {len(removed_dates)}, {record_count} записей за {elapsed:.2f} с")
+    return touched_dates
+
+def load_data_streaming(conn, config, method='copy', chunksize=STREAM_CHUNK_ROWS, queue_size=STREAM_QUEUE_SIZE):
+    """Функция для потоковой загрузки CSV порциями: чтение и подготовка порций идут в отдельном
+    потоке, загрузка в БД - в текущем; между ними ограниченная очередь на queue_size порций"""
+    table_name = config['table_name']
+    chunks = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        # Очередь может быть заполнена, а загрузка - уже остановлена ошибкой: ждем место, пока не задан stop
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        seen_keys = set()
+        try:
+            for chunk in read_csv_chunks(config['csv_file'], config['date_columns'],
+                                         config['date_formats'], chunksize):
+                chunk = prepare_data(chunk, table_name, config['key_columns'], seen_keys)
+                if not put(chunk):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    start = time.perf_counter()
+    producer.start()
+
+    record_count = 0
+    try:
+        with conn.cursor() as cur:
+            # Очищаем таблицу
+            cur.execute(f"TRUNCATE TABLE {table_name};")
+            integer_columns = get_integer_columns(cur, table_name)
+
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if chunk.empty:
+                    continue
+                if config.get('partition_column'):
+                    # Секции создаются в транзакции загрузки: иначе фиксировался бы и TRUNCATE
+                    ensure_partitions(conn, chunk, table_name, config['partition_column'], commit=False)
+                if method == 'copy':
+                    copy_rows(cur, chunk, table_name, integer_columns)
+                else:
+                    insert_rows(cur, chunk, table_name)
+                record_count += len(chunk)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        stop.set()
+        producer.join()
+
+    elapsed = time.perf_counter() - start
+    rate = record_count / elapsed if elapsed > 0 else 0
+    print(f"✅ Данные в {table_name} загружены: {record_count} записей")
+    print(f"⚡ {method.upper()} (потоково): {elapsed:.2f} с, {rate:,.0f} записей/с")
+    return record_count
+
+# Конфигурация всех таблиц
+TABLES_CONFIG = [
+    {
+        'csv_file': 'csv_files/md_account_d.csv',
+        'table_name': 'DS.MD_ACCOUNT_D',
+        'date_columns': ['data_actual_date', 'data_actual_end_date'],
+        'date_formats': {'data_actual_date': '%Y-%m-%d', 'data_actual_end_date': '%Y-%m-%d'},
+        'key_columns': None
+    },
+    {
+        'csv_file': 'csv_files/md_currency_d.csv',
+        'table_name': 'DS.MD_CURRENCY_D',
+        'date_columns': ['data_actual_date', 'data_actual_end_date'],
+        'date_formats': {'data_actual_date': '%Y-%m-%d', 'data_actual_end_date': '%Y-%m-%d'},
+        'key_columns': None
+    },
+    {
+        'csv_file': 'csv_files/md_exchange_rate_d.csv',
+        'table_name': 'DS.MD_EXCHANGE_RATE_D',
+        'date_columns': ['data_actual_date', 'data_actual_end_date'],
+        'date_formats': {'data_actual_date': '%Y-%m-%d', 'data_actual_end_date': '%Y-%m-%d'},
+        'key_columns': ['data_actual_date', 'currency_rk'],
+        'rate_calendar': True
+    },
+    {
+        'csv_file': 'csv_files/md_ledger_account_s.csv',
+        'table_name': 'DS.MD_LEDGER_ACCOUNT_S',
+        'date_columns': ['start_date', 'end_date'],
+        'date_formats': {'start_date': '%Y-%m-%d', 'end_date': '%Y-%m-%d'},
+        'key_columns': None
+    },
+    {
+        'csv_file': 'csv_files/ft_posting_f.csv',
+        'table_name': 'DS.FT_POSTING_F',
+        'date_columns': ['oper_date'],
+        'date_formats': {'oper_date': '%d-%m-%Y'},
+        'key_columns': None,
+        'incremental_column': 'oper_date',
+        'partition_column': 'oper_date'
+    },
+    {
+        'csv_file': 'csv_files/ft_balance_f.csv',
+        'table_name': 'DS.FT_BALANCE_F',
+        'date_columns': ['on_date'],
+        'date_formats': {'on_date': '%d.%m.%Y'},
+        'key_columns': ['on_date', 'account_rk']
+    }
+]
+
+def load_table(config, method='copy', streaming=False, chunksize=STREAM_CHUNK_ROWS, incremental=False,
+               merge=True, use_cache=True, force=False, logger=None, run_id=None):
+    """Загрузка одной таблицы в собственном соединении (для параллельной загрузки).
+    Таблицы с ключами в TABLE_KEYS при merge=True загружаются в режиме UPSERT;
+    при use_cache=True разобранные файлы берутся из кэша csv_cache;
+    таблица пропускается, если исходный файл не менялся с последней загрузки (кроме force=True).
+    События пишутся в общий буфер logger; без него создается свой журнал с run_id,
+    который сбрасывается в БД по окончании загрузки таблицы.
+    Возвращает словарь с результатом: status, rows и touched_dates (для инкрементальной загрузки)"""
+    table_name = config['table_name']
+    result = {'table_name': table_name, 'status': 'FAILED', 'rows': 0, 'touched_dates': None}
+    own_logger = logger is None
+    if own_logger:
+        logger = EtlLogger(run_id)
+
+    try:
+        with get_connection('etl') as conn:
+            print(f"\n📊 === Загрузка {table_name} ===")
+            
+            log_id = logger.start(table_name)
+            ensure_manifest(conn)
+            incremental = incremental and config.get('incremental_column') is not None
+            content_hash = csv_cache.file_fingerprint(config['csv_file'])
+            
+            if not force and is_load_unchanged(conn, table_name, content_hash):
+                print(f"⏭️ {table_name}: файл {config['csv_file']} не изменился, загрузка пропущена")
+                logger.end(log_id, 0, status='SKIPPED', message="Файл не изменился с последней загрузки")
+                result.update(status='SKIPPED', touched_dates=set() if incremental else None)
+                return result
+            
+            merge_keys = TABLE_KEYS.get(table_name) if merge else None
+            
+            if streaming and not incremental and not merge_keys:
+                try:
+                    if config.get('incremental_column') is not None:
+                        begin_full_reload(conn, table_name)
+                    record_count = load_data_streaming(conn, config, method, chunksize)
+                    if config.get('incremental_column') is not None:
+                        reset_posting_state(conn)
+                    # После массовой загрузки статистика планировщика устарела
+                    analyze_tables(conn, [table_name])
+                    if config.get('rate_calendar'):
+                        refresh_rate_calendar(conn)
+                    # Манифест - после всех шагов загрузки: при ошибке файл будет загружен заново
+                    update_manifest(conn, table_name, config['csv_file'], content_hash)
+                except Exception as e:
+                    print(f"❌ Ошибка потоковой загрузки {table_name}: {e}")
+                    logger.end(log_id, 0, status='FAILED')
+                    return result
+                logger.end(log_id, record_count, status='SUCCESS')
+                result.update(status='SUCCESS', rows=record_count)
+                return result
+            
+            df = read_csv_cached(config, use_cache)
+            
+            if df is None or df.empty:
+                print(f"⚠️ Нет данных для загрузки {table_name}")
+                logger.end(log_id, 0, status='FAILED')
+                return result
+            
+            if config.get('partition_column'):
+                ensure_partitions(conn, df, table_name, config['partition_column'])
+            
+            message = None
+            deleted_count = 0
+            try:
+                if merge_keys:
+                    counts = merge_data(conn, df, table_name, merge_keys, method)
+                    record_count = counts['inserted'] + counts['updated']
+                    deleted_count = counts['deleted']
+                    message = (f"UPSERT: вставлено {counts['inserted']}, обновлено {counts['updated']}, "
+                               f"без изменений {counts['unchanged']}, удалено {counts['deleted']}")
+                elif incremental:
+                    df = prepare_data(df, table_name, config['key_columns'])
+                    touched_dates = load_postings_incremental(conn, df, table_name, config['incremental_column'])
+                    loaded_dates = pd.to_datetime(df[config['incremental_column']]).dt.date
+                    record_count = int(loaded_dates.isin(touched_dates).sum())
+                    result['touched_dates'] = touched_dates
+                else:
+                    if config.get('incremental_column') is not None:
+                        begin_full_reload(conn, table_name)
+                    record_count = load_data(conn, df, table_name, config['key_columns'], method)
+                    if config.get('incremental_column') is not None:
+                        reset_posting_state(conn)
+                
+                # После массовой загрузки статистика планировщика устарела
+                if record_count or deleted_count:
+                    analyze_tables(conn, [table_name])
+                # Календарь курсов обновляется за даты действия загруженных курсов (открытый интервал -
+                # до конца календаря); удаленные курсы могли действовать на любые даты - тогда весь календарь
+                if deleted_count and config.get('rate_calendar'):
+                    refresh_rate_calendar(conn)
+                elif record_count and config.get('rate_calendar'):
+                    end_dates = pd.to_datetime(df['data_actual_end_date'])
+                    refresh_rate_calendar(conn, pd.to_datetime(df['data_actual_date']).min().date(),
+                                          None if end_dates.isna().any() else end_dates.max().date())
+                # Манифест - после всех шагов загрузки: при ошибке файл будет загружен заново
+                update_manifest(conn, table_name, config['csv_file'], content_hash)
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Ошибка загрузки {table_name}: {e}")
+                logger.end(log_id, 0, status='FAILED')
+                return result
+            
+            logger.end(log_id, record_count, status='SUCCESS', message=message)
+            result.update(status='SUCCESS', rows=record_count)
+            return result
+    except psycopg2.OperationalError as e:
+        print(f"❌ Не удалось подключиться к базе данных для {table_name}: {e}")
+        return result
+    finally:
+        if own_logger:
+            logger.flush()
+
+def load_all_tables(method='copy', streaming=False, chunksize=STREAM_CHUNK_ROWS,
+                    workers=LOAD_WORKERS, pool='thread', incremental=False, merge=True, use_cache=True,
+                    force=False):
+    """Загрузка всех таблиц (method: 'copy' - через COPY, 'insert' - через execute_values;
+    streaming=True - чтение и загрузка файлов порциями по chunksize записей;
+    workers - число таблиц, загружаемых одновременно, pool - 'thread' или 'process';
+    incremental=True - проводки загружаются инкрементально по датам операций;
+    merge=True - таблицы с ключами в TABLE_KEYS загружаются в режиме UPSERT, False - TRUNCATE + загрузка;
+    use_cache=True - неизменившиеся файлы берутся из кэша разобранных колонок, без повторного разбора;
+    force=True - загружать таблицы, даже если исходный файл не менялся с последней загрузки).
+    Возвращает словарь {таблица: множество затронутых дат} для инкрементально загруженных таблиц"""
+    # Создаем схему LOGS и служебные таблицы заранее: параллельный CREATE TABLE IF NOT EXISTS
+    # из нескольких соединений может завершиться ошибкой уникальности в системном каталоге
+    try:
+        with get_connection('etl') as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE SCHEMA IF NOT EXISTS LOGS;")
+                cur.execute(create_posting_state_sql)
+            conn.commit()
+            ensure_schema(conn)
+            ensure_manifest(conn)
+    except psycopg2.Error as e:
+        print(f"❌ Ошибка при подключении к базе данных: {e}")
+        return {}
+    print(f"✅ Успешное подключение к базе данных {DB_CONFIG['database']} на {DB_CONFIG['host']}:{DB_CONFIG['port']}")
 
     print("🏦 ЗАГРУЗКА БАНКОВСКОЙ БАЗЫ ДАННЫХ")
     print("=" * 50)
     
-    total_records = 0
+    start = time.perf_counter()
+    # Журнал запуска: в потоках общий буфер, в процессах - свой буфер на таблицу с тем же run_id
+    logger = EtlLogger()
+    failed_tables = []
+    skipped_tables = []
+    touched_dates = {}
     
-    for config in tables_config:
-        print(f"\n📊 === Загрузка {config['table_name']} ===")
-        
-        log_id = log_start(conn, config['table_name'])
-        
-        df = read_csv_with_encoding(
-            config['csv_file'], 
-            config['date_columns'], 
-            config['date_formats']
-        )
-        
-        if df is None or df.empty:
-            print(f"⚠️ Нет данных для загрузки {config['table_name']}")
-            log_end(conn, log_id, 0, status='FAILED')
-            continue
-        
-        record_count = load_data(conn, df, config['table_name'], config['key_columns'])
-        total_records += record_count
-        
-        log_end(conn, log_id, record_count, status='SUCCESS')
+    # Таблицы не связаны внешними ключами, поэтому загружаются независимо;
+    # крупные файлы ставим в очередь первыми, чтобы они не оказались в конце
+    tables_by_size = sorted(TABLES_CONFIG, key=lambda config: os.path.getsize(config['csv_file']), reverse=True)
+    executor_class = ProcessPoolExecutor if pool == 'process' else ThreadPoolExecutor
+    
+    with executor_class(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(load_table, config, method, streaming, chunksize, incremental, merge,
+                            use_cache, force, logger if pool != 'process' else None,
+                            logger.run_id): config['table_name']
+            for config in tables_by_size
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"❌ Ошибка загрузки {futures[future]}: {e}")
+                result = {'status': 'FAILED', 'touched_dates': None}
+            if result['status'] == 'FAILED':
+                failed_tables.append(futures[future])
+            elif result['status'] == 'SKIPPED':
+                skipped_tables.append(futures[future])
+            if result['touched_dates'] is not None:
+                touched_dates[futures[future]] = result['touched_dates']
+    
+    elapsed = time.perf_counter() - start
+    # Граница этапа загрузки: все события пишутся одной транзакцией
+    logger.flush()
     
     # Итоговая статистика
     print(f"\n🎯 ИТОГОВАЯ СТАТИСТИКА")
     print("=" * 40)
     
-    with conn.cursor() as cur:
-        tables = [config['table_name'] for config in tables_config]
+    with get_connection('etl') as conn, conn.cursor() as cur:
+        tables = [config['table_name'] for config in TABLES_CONFIG]
         final_total = 0
         
         for table in tables:
@@ -236,35 +826,48 @@ def load_all_tables():
             print(f"{table}: {count:,} записей")
     
     print(f"\n🏆 ВСЕГО ЗАГРУЖЕНО: {final_total:,} записей")
-    print("✅ ЗАГРУЗКА ЗАВЕРШЕНА УСПЕШНО!")
+    print(f"⏱️ Общее время загрузки: {elapsed:.2f} с (потоков: {max(1, workers)})")
+    print(f"🧾 Запуск {logger.run_id}: события в LOGS.etl_logs")
+    if skipped_tables:
+        print(f"⏭️ Пропущены (файл не изменился): {', '.join(skipped_tables)}")
+    if failed_tables:
+        print(f"❌ Не загружены: {', '.join(failed_tables)}")
+    else:
+        print("✅ ЗАГРУЗКА ЗАВЕРШЕНА УСПЕШНО!")
+    for table, dates in touched_dates.items():
+        if dates:
+            print(f"📅 {table}: затронуто дат {len(dates)} ({min(dates)} - {max(dates)})")
+        else:
+            print(f"📅 {table}: изменений нет")
+    print_pool_stats()
     
-    conn.close()
+    return touched_dates
 
 def main():
     """Основная функция - загружает одну таблицу FT_BALANCE_F (как было изначально)"""
-    conn = connect_db()
-    if conn is None:
-        print("Не удалось подключиться к базе данных. Завершаем.")
-        return
-
-    table_name = 'DS.FT_BALANCE_F'
-    log_id = log_start(conn, table_name)
-
-    df = read_csv_with_encoding(
-        'csv_files/ft_balance_f.csv', 
-        ['on_date'], 
-        {'on_date': '%d.%m.%Y'}
-    )
-    
-    if df is None or df.empty:
-        print("Нет данных для загрузки. Завершаем.")
-        log_end(conn, log_id, 0, status='FAILED')
-        conn.close()
-        return
-
-    record_count = load_data(conn, df, table_name, ['on_date', 'account_rk'])
-    log_end(conn, log_id, record_count, status='SUCCESS')
-    conn.close()
+    logger = EtlLogger()
+    try:
+        with get_connection('etl') as conn:
+            table_name = 'DS.FT_BALANCE_F'
+            log_id = logger.start(table_name)
+
+            df = read_csv_with_encoding(
+                'csv_files/ft_balance_f.csv', 
+                ['on_date'], 
+                {'on_date': '%d.%m.%Y'}
+            )
+            
+            if df is None or df.empty:
+                print("Нет данных для загрузки. Завершаем.")
+                logger.end(log_id, 0, status='FAILED')
+                return
+
+            record_count = load_data(conn, df, table_name, ['on_date', 'account_rk'])
+            logger.end(log_id, record_count, status='SUCCESS')
+    except psycopg2.OperationalError as e:
+        print(f"Не удалось подключиться к базе данных: {e}")
+    finally:
+        logger.flush()
 
 if __name__ == '__main__':
     load_all_tables()
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import sys
+from datetime import date
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
+
+# Прежний расчет оборотов: два прохода по проводкам (кредит и дебет), соединение со счетами
+# и курсами для каждой стороны отдельно и FULL OUTER JOIN результатов
+old_turnover_sql = """
+SELECT
+    COALESCE(cr.on_date, db.on_date) as on_date,
+    COALESCE(cr.account_rk, db.account_rk) as account_rk,
+    COALESCE(cr.credit_amount, 0) as credit_amount,
+    COALESCE(cr.credit_amount_rub, 0) as credit_amount_rub,
+    COALESCE(db.debet_amount, 0) as debet_amount,
+    COALESCE(db.debet_amount_rub, 0) as debet_amount_rub
+FROM
+    (SELECT
+        p.oper_date as on_date,
+        p.credit_account_rk as account_rk,
+        SUM(p.credit_amount) as credit_amount,
+        SUM(p.credit_amount * COALESCE(er.reduced_cource, 1)) as credit_amount_rub
+    FROM DS.FT_POSTING_F p
+    LEFT JOIN DS.MD_ACCOUNT_D acc ON p.credit_account_rk = acc.account_rk
+        AND p.oper_date BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+    LEFT JOIN DS.MD_EXCHANGE_RATE_D er ON acc.currency_rk = er.currency_rk
+        AND er.data_actual_date = p.oper_date
+    WHERE p.oper_date BETWEEN %(date_from)s AND %(date_to)s
+    GROUP BY p.oper_date, p.credit_account_rk
+    ) cr
+FULL OUTER JOIN
+    (SELECT
+        p.oper_date as on_date,
+        p.debet_account_rk as account_rk,
+        SUM(p.debet_amount) as debet_amount,
+        SUM(p.debet_amount * COALESCE(er.reduced_cource, 1)) as debet_amount_rub
+    FROM DS.FT_POSTING_F p
+    LEFT JOIN DS.MD_ACCOUNT_D acc ON p.debet_account_rk = acc.account_rk
+        AND p.oper_date BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+    LEFT JOIN DS.MD_EXCHANGE_RATE_D er ON acc.currency_rk = er.currency_rk
+        AND er.data_actual_date = p.oper_date
+    WHERE p.oper_date BETWEEN %(date_from)s AND %(date_to)s
+    GROUP BY p.oper_date, p.debet_account_rk
+    ) db ON cr.on_date = db.on_date AND cr.account_rk = db.account_rk
+"""
+
+# Новый расчет (как в ds.fill_account_turnover_range_f): один проход по проводкам со сверткой по парам
+# счетов, две ноги на пару, условная агрегация и одно соединение со счетами и курсами на (дату, счет).
+# Курсы берутся из DS.MD_EXCHANGE_RATE_D, как в старом расчете, чтобы сравнивались только способы свертки
+new_turnover_sql = """
+SELECT
+    turn.on_date,
+    turn.account_rk,
+    turn.credit_amount,
+    turn.credit_amount * COALESCE(er.reduced_cource, 1)::NUMERIC as credit_amount_rub,
+    turn.debet_amount,
+    turn.debet_amount * COALESCE(er.reduced_cource, 1)::NUMERIC as debet_amount_rub
+FROM
+    (SELECT
+        pair.oper_date as on_date,
+        leg.account_rk,
+        COALESCE(SUM(leg.credit_amount), 0) as credit_amount,
+        COALESCE(SUM(leg.debet_amount), 0) as debet_amount
+    FROM
+        (SELECT
+            p.oper_date,
+            p.credit_account_rk,
+            p.debet_account_rk,
+            SUM(p.credit_amount)::NUMERIC as credit_amount,
+            SUM(p.debet_amount)::NUMERIC as debet_amount
+        FROM DS.FT_POSTING_F p
+        WHERE p.oper_date BETWEEN %(date_from)s AND %(date_to)s
+        GROUP BY p.oper_date, p.credit_account_rk, p.debet_account_rk
+        ) pair
+    CROSS JOIN LATERAL (VALUES
+        (pair.credit_account_rk, pair.credit_amount, NULL::NUMERIC),
+        (pair.debet_account_rk, NULL::NUMERIC, pair.debet_amount)
+    ) AS leg(account_rk, credit_amount, debet_amount)
+    GROUP BY pair.oper_date, leg.account_rk
+    ) turn
+LEFT JOIN DS.MD_ACCOUNT_D acc ON turn.account_rk = acc.account_rk
+    AND turn.on_date BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+LEFT JOIN DS.MD_EXCHANGE_RATE_D er ON acc.currency_rk = er.currency_rk
+    AND er.data_actual_date = turn.on_date
+"""
+
+# Сравнение результатов: число строк и наибольшее расхождение сумм (старый расчет суммирует FLOAT)
+compare_sql = f"""
+SELECT COUNT(*) as total_rows,
+       COUNT(*) FILTER (WHERE o.account_rk IS NULL OR n.account_rk IS NULL) as missing_rows,
+       COALESCE(MAX(GREATEST(ABS(o.credit_amount - n.credit_amount), ABS(o.credit_amount_rub - n.credit_amount_rub),
+                             ABS(o.debet_amount - n.debet_amount), ABS(o.debet_amount_rub - n.debet_amount_rub))), 0)
+FROM ({old_turnover_sql}) o
+FULL OUTER JOIN ({new_turnover_sql}) n ON o.on_date = n.on_date AND o.account_rk = n.account_rk
+"""
+
+def scale_postings(cur, scale):
+    """Функция для увеличения набора проводок в scale раз (копии существующих строк)"""
+    if scale > 1:
+        cur.execute("""
+            INSERT INTO DS.FT_POSTING_F
+            SELECT p.* FROM DS.FT_POSTING_F p CROSS JOIN generate_series(1, %s);
+        """, (scale - 1,))
+    cur.execute("ANALYZE DS.FT_POSTING_F;")
+    cur.execute("SELECT COUNT(*) FROM DS.FT_POSTING_F;")
+    return cur.fetchone()[0]
+
+def explain(cur, sql, params):
+    """Функция для EXPLAIN ANALYZE запроса: время выполнения, прочитанные буферы и план"""
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+    result = cur.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    plan = result[0]
+    buffers = plan['Plan'].get('Shared Hit Blocks', 0) + plan['Plan'].get('Shared Read Blocks', 0)
+    return plan['Execution Time'], buffers, plan
+
+def count_scans(node, relation):
+    """Функция для подсчета чтений таблицы relation в плане. Таблица секционирована, и в плане
+    читаются секции (relation_2018_01 ...) - узлы сопоставляются по префиксу имени, а Append
+    над секциями считается одним чтением таблицы"""
+    children = node.get('Plans', [])
+    if node.get('Relation Name', '').startswith(relation):
+        return 1
+    if node['Node Type'] in ('Append', 'Merge Append') and children and all(
+            child.get('Relation Name', '').startswith(relation) for child in children):
+        return 1
+    return sum(count_scans(child, relation) for child in children)
+
+def bench_turnover(date_from, date_to, scale=20, runs=3):
+    """Функция для сравнения старого и нового расчета оборотов через EXPLAIN ANALYZE на увеличенном
+    наборе проводок. Все изменения выполняются в транзакции, которая откатывается"""
+    params = {'date_from': date_from, 'date_to': date_to}
+    with get_connection('dm') as conn, conn.cursor() as cur:
+        postings = scale_postings(cur, scale)
+        print(f"Проводок в наборе: {postings:,} (x{scale}), период {date_from} - {date_to}")
+        print("-" * 60)
+
+        timings = {}
+        for name, sql in (('старый (2 прохода + FULL JOIN)', old_turnover_sql),
+                          ('новый (1 проход, условные суммы)', new_turnover_sql)):
+            # Первый запуск прогревает кэш, в зачет идет лучшее время из runs запусков
+            results = [explain(cur, sql, params) for _ in range(runs + 1)][1:]
+            best_time, buffers, plan = min(results, key=lambda result: result[0])
+            timings[name] = best_time
+            scans = count_scans(plan['Plan'], 'ft_posting_f')
+            print(f"{name}: {best_time:.1f} мс, буферов {buffers:,}, чтений FT_POSTING_F в плане: {scans}")
+
+        cur.execute(compare_sql, params)
+        total_rows, missing_rows, max_diff = cur.fetchone()
+        conn.rollback()
+
+    old_time, new_time = timings.values()
+    print("-" * 60)
+    print(f"Ускорение: x{old_time / new_time:.2f}")
+    print(f"Строк в результате: {total_rows}, несовпадающих ключей: {missing_rows}, "
+          f"наибольшее расхождение сумм: {max_diff}")
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение старого и нового расчета оборотов (EXPLAIN ANALYZE)")
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, default=date(2018, 1, 1))
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, default=date(2018, 1, 31))
+    parser.add_argument('--scale', type=int, default=20, help="во сколько раз увеличить набор проводок")
+    parser.add_argument('--runs', type=int, default=3, help="число замеров каждого запроса")
+    args = parser.parse_args()
+    try:
+        bench_turnover(args.date_from, args.date_to, args.scale, args.runs)
+    except Exception as e:
+        print(f"Ошибка замера: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Проверка параллельного расчета оборотов порциями в целый месяц:
+    python check_month_chunks.py
+
+Порция, покрывающая месяц целиком, очищает секцию витрины оборотов через TRUNCATE
+(ds.clear_period_f), которому нужна блокировка ACCESS EXCLUSIVE. Если основное соединение run_dm
+держит блокировку секции после чтения контрольных точек и отпечатков, поток с TRUNCATE ждет его,
+а основной поток ждет потоки - расчет зависает. Скрипт запускает run_dm с порциями по 31 дню
+и считает проверку проваленной, если расчет не завершился за CHECK_TIMEOUT секунд.
+"""
+import os
+import sys
+import threading
+from datetime import date
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from run_dm import run_dm
+
+# Время, за которое расчет месяца должен завершиться, с
+CHECK_TIMEOUT = 120
+
+def check_month_chunks(date_from, date_to, jobs=2):
+    """Функция для запуска run_dm с порциями оборотов по 31 дню в отдельном потоке.
+    Возвращает True, если расчет завершился за CHECK_TIMEOUT секунд и дошел до date_to"""
+    result = {}
+    worker = threading.Thread(
+        target=lambda: result.update(done_date=run_dm(date_from, date_to, jobs=jobs, chunk_days=31)),
+        daemon=True)
+    worker.start()
+    worker.join(CHECK_TIMEOUT)
+    if worker.is_alive():
+        print(f"❌ Расчет с порциями в целый месяц не завершился за {CHECK_TIMEOUT} с - взаимная блокировка")
+        return False
+    if result.get('done_date') != date_to:
+        print(f"❌ Расчет остановился на {result.get('done_date')} вместо {date_to}")
+        return False
+    print("Расчет с порциями в целый месяц завершен без взаимной блокировки.")
+    return True
+
+def main():
+    try:
+        ok = check_month_chunks(date(2018, 1, 1), date(2018, 1, 31))
+    except Exception as e:
+        print(f"Ошибка проверки: {e}")
+        ok = False
+    # Зависший поток расчета не должен удерживать процесс
+    os._exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+from datetime import date, timedelta
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
+
+# Строки витрины, посчитанные одним из способов, во временную таблицу
+snapshot_sql = """
+CREATE TEMP TABLE {name} ON COMMIT DROP AS
+SELECT * FROM {table}
+WHERE on_date BETWEEN %s AND %s;
+"""
+
+# Допустимое расхождение сумм: проводки хранятся во FLOAT, и порядок их суммирования
+# (а значит, последний знак суммы) зависит от плана запроса
+AMOUNT_TOLERANCE = 0.0001
+
+# Строки, которые есть только в одном из результатов или суммы в которых расходятся
+diff_sql = """
+SELECT COALESCE(d.on_date, r.on_date) as on_date,
+       COALESCE(d.account_rk, r.account_rk) as account_rk,
+       CASE WHEN r.account_rk IS NULL THEN 'только по дням'
+            WHEN d.account_rk IS NULL THEN 'только за период'
+            ELSE 'суммы расходятся' END as problem
+FROM by_day d
+FULL OUTER JOIN by_range r ON d.on_date = r.on_date AND d.account_rk = r.account_rk
+WHERE d.account_rk IS NULL OR r.account_rk IS NULL OR {amounts_differ}
+ORDER BY 1, 2;
+"""
+
+def compare_range(table, day_function, range_function, date_from, date_to, prepare=None):
+    """Функция для сверки процедуры за период с процедурой по дням на таблице table:
+    оба расчета выполняются в одной транзакции, которая затем откатывается,
+    поэтому витрины и логи не меняются. Возвращает список расхождений"""
+    with get_connection('dm') as conn, conn.cursor() as cur:
+        if prepare:
+            cur.execute(prepare, (date_from, date_to))
+
+        current_date = date_from
+        while current_date <= date_to:
+            cur.execute(f"SELECT {day_function}(%s)", (current_date,))
+            current_date += timedelta(days=1)
+        cur.execute(snapshot_sql.format(name='by_day', table=table), (date_from, date_to))
+
+        cur.execute(f"SELECT {range_function}(%s, %s)", (date_from, date_to))
+        cur.execute(snapshot_sql.format(name='by_range', table=table), (date_from, date_to))
+
+        cur.execute("SELECT COUNT(*) FROM by_range")
+        count = cur.fetchone()[0]
+        cur.execute("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+              AND attname NOT IN ('on_date', 'account_rk')
+            ORDER BY attnum;
+        """, (table,))
+        amounts_differ = ' OR '.join(f"ABS(d.{column} - r.{column}) > {AMOUNT_TOLERANCE}"
+                                     for (column,) in cur.fetchall())
+        cur.execute(diff_sql.format(amounts_differ=amounts_differ or 'FALSE'))
+        differences = cur.fetchall()
+        conn.rollback()
+
+    print(f"Сверка {table} за {date_from} - {date_to}: {count} записей, расхождений: {len(differences)}")
+    for row in differences[:20]:
+        print("  ", row)
+    return differences
+
+def compare_turnover_range(date_from, date_to):
+    """Сверка ds.fill_account_turnover_range_f с ds.fill_account_turnover_f"""
+    return compare_range('DM.DM_ACCOUNT_TURNOVER_F', 'ds.fill_account_turnover_f',
+                         'ds.fill_account_turnover_range_f', date_from, date_to)
+
+def compare_balance_range(date_from, date_to):
+    """Сверка ds.fill_account_balance_range_f с ds.fill_account_balance_f
+    (обороты периода предварительно пересчитываются в той же транзакции)"""
+    return compare_range('DM.DM_ACCOUNT_BALANCE_F', 'ds.fill_account_balance_f',
+                         'ds.fill_account_balance_range_f', date_from, date_to,
+                         prepare="SELECT ds.fill_account_turnover_range_f(%s, %s)")
+
+def main():
+    try:
+        date_from, date_to = date(2018, 1, 1), date(2018, 1, 31)
+        differences = compare_turnover_range(date_from, date_to) + compare_balance_range(date_from, date_to)
+        if differences:
+            print("Результаты расчета по дням и за период НЕ совпадают!")
+        else:
+            print("Результаты расчета по дням и за период совпадают.")
+    except Exception as e:
+        print(f"Ошибка сверки: {e}")
+
+if __name__ == "__main__":
+    main()
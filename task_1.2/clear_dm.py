@@ -1,40 +1,48 @@
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
 
 
 
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Удаление витрин и процедур...")
-        
-        # Удаляем таблицы витрин
-        cur.execute("DROP TABLE IF EXISTS DM.DM_ACCOUNT_TURNOVER_F CASCADE;")
-        cur.execute("DROP TABLE IF EXISTS DM.DM_ACCOUNT_BALANCE_F CASCADE;")
-        
-        # Удаляем процедуры
-        cur.execute("DROP FUNCTION IF EXISTS ds.fill_account_turnover_f(DATE) CASCADE;")
-        cur.execute("DROP FUNCTION IF EXISTS ds.fill_account_balance_f(DATE) CASCADE;")
-        
-        # Удаляем схему если пустая (опционально)
-        # cur.execute("DROP SCHEMA IF EXISTS DM CASCADE;")
-        
-        conn.commit()
-        print("Витрины и процедуры удалены!")
-        print("Теперь можно заново создавать!")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Удаление витрин и процедур...")
+                
+                # Удаляем таблицы витрин
+                cur.execute("DROP TABLE IF EXISTS DM.DM_ACCOUNT_TURNOVER_F CASCADE;")
+                cur.execute("DROP TABLE IF EXISTS DM.DM_ACCOUNT_BALANCE_F CASCADE;")
+                cur.execute("DROP TABLE IF EXISTS DM.DM_RATE_CALENDAR CASCADE;")
+
+                # Удаляем контрольные точки расчета - без витрин они недействительны
+                cur.execute("DROP TABLE IF EXISTS LOGS.dm_checkpoints;")
+                
+                # Удаляем процедуры
+                cur.execute("DROP FUNCTION IF EXISTS ds.fill_account_turnover_f(DATE) CASCADE;")
+                cur.execute("DROP FUNCTION IF EXISTS ds.fill_account_balance_f(DATE) CASCADE;")
+                cur.execute("DROP FUNCTION IF EXISTS ds.fill_account_turnover_range_f(DATE, DATE) CASCADE;")
+                cur.execute("DROP FUNCTION IF EXISTS ds.clear_period_f(TEXT, DATE, DATE) CASCADE;")
+                cur.execute("DROP FUNCTION IF EXISTS ds.fill_rate_calendar_f(DATE, DATE) CASCADE;")
+                cur.execute("DROP FUNCTION IF EXISTS ds.check_missing_rates_f(TEXT, DATE, DATE) CASCADE;")
+                cur.execute("DROP FUNCTION IF EXISTS ds.fill_account_balance_range_f(DATE, DATE, INTEGER[]) CASCADE;")
+
+                # Удаляем отслеживание измененных дат (вместе с функцией удаляются триггеры на DS.FT_POSTING_F)
+                cur.execute("DROP FUNCTION IF EXISTS ds.mark_dirty_postings_f() CASCADE;")
+                cur.execute("DROP TABLE IF EXISTS LOGS.dm_dirty_dates;")
+                cur.execute("DROP TABLE IF EXISTS LOGS.dm_full_reloads;")
+                
+                # Удаляем схему если пустая (опционально)
+                # cur.execute("DROP SCHEMA IF EXISTS DM CASCADE;")
+            
+            conn.commit()
+            print("Витрины и процедуры удалены!")
+            print("Теперь можно заново создавать!")
         
     except Exception as e:
         print(f"Ошибка: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,7 @@
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
 
 
@@ -9,6 +11,9 @@ CREATE SCHEMA IF NOT EXISTS DM;
 
 
 create_dm_tables = """
+-- Витрины секционированы по месяцам on_date; секции DM.<витрина>_ГГГГ_ММ создает run_dm.py,
+-- секции по умолчанию нет
+
 -- Витрина оборотов по лицевым счетам
 
 CREATE TABLE IF NOT EXISTS DM.DM_ACCOUNT_TURNOVER_F (
@@ -17,8 +22,9 @@ CREATE TABLE IF NOT EXISTS DM.DM_ACCOUNT_TURNOVER_F (
         credit_amount NUMERIC(23,8),
         credit_amount_rub NUMERIC(23,8),
         debet_amount NUMERIC(23,8),
-        debet_amount_rub NUMERIC(23,8)
-);
+        debet_amount_rub NUMERIC(23,8),
+        PRIMARY KEY (on_date, account_rk)
+) PARTITION BY RANGE (on_date);
 
 --Витрина остатков по лицевым счетам
 
@@ -26,33 +32,35 @@ CREATE TABLE IF NOT EXISTS DM.DM_ACCOUNT_BALANCE_F (
         on_date DATE,
         account_rk INTEGER,
         balance_out NUMERIC(23,8),
-        balance_out_rub NUMERIC(23,8)
+        balance_out_rub NUMERIC(23,8),
+        PRIMARY KEY (on_date, account_rk)
+) PARTITION BY RANGE (on_date);
+
+-- Календарь курсов: курс каждой валюты на каждый день (по интервалам действия курсов)
+
+CREATE TABLE IF NOT EXISTS DM.DM_RATE_CALENDAR (
+        on_date DATE NOT NULL,
+        currency_rk INTEGER NOT NULL,
+        rate FLOAT,
+        PRIMARY KEY (on_date, currency_rk)
 );
 """
 
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Creating schemas...")
-        cur.execute(create_schema_sql)
-        
-        print("Creating tables...")
-        cur.execute(create_dm_tables)
-        
-        conn.commit()
-        print("Schemas and tables created successfully.")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Creating schemas...")
+                cur.execute(create_schema_sql)
+                
+                print("Creating tables...")
+                cur.execute(create_dm_tables)
+            
+            conn.commit()
+            print("Schemas and tables created successfully.")
         
     except Exception as e:
         print(f"Error: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
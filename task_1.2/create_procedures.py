@@ -1,9 +1,44 @@
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
 
 
 
+# Проверка календаря курсов: строки витрины за период по счетам в иностранной валюте (у валюты есть
+# курсы в DS.MD_EXCHANGE_RATE_D), для которых в DM.DM_RATE_CALENDAR нет курса на дату строки.
+# Рублевая сумма таких строк посчитана по курсу 1 - функция выдает WARNING и возвращает их число
+
+create_missing_rates_procedure = """
+CREATE OR REPLACE FUNCTION ds.check_missing_rates_f(i_table TEXT, i_from DATE, i_to DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    missing_count INTEGER;
+    missing_from DATE;
+    missing_to DATE;
+BEGIN
+    EXECUTE format('
+        SELECT COUNT(*), MIN(t.on_date), MAX(t.on_date)
+        FROM %s t
+        JOIN DS.MD_ACCOUNT_D acc ON t.account_rk = acc.account_rk
+            AND t.on_date BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+        WHERE t.on_date BETWEEN $1 AND $2
+          AND EXISTS (SELECT 1 FROM DS.MD_EXCHANGE_RATE_D er WHERE er.currency_rk = acc.currency_rk)
+          AND NOT EXISTS (SELECT 1 FROM DM.DM_RATE_CALENDAR rc
+                          WHERE rc.on_date = t.on_date AND rc.currency_rk = acc.currency_rk)', i_table)
+    INTO missing_count, missing_from, missing_to
+    USING i_from, i_to;
+    
+    IF missing_count > 0 THEN
+        RAISE WARNING '%: % строк в валюте без курса в DM.DM_RATE_CALENDAR за % - % (рублевая сумма по курсу 1)',
+            i_table, missing_count, missing_from, missing_to;
+    END IF;
+    RETURN missing_count;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
 # Процедура расчета оборотов
 
 create_turnover_procedure = """
@@ -12,6 +47,7 @@ RETURNS VOID AS $$
 DECLARE
     log_id INTEGER;
     record_count INTEGER := 0;
+    missing_rates INTEGER := 0;
 BEGIN
     -- Логирование начала
     INSERT INTO LOGS.etl_logs (table_name, status, start_time)
@@ -21,7 +57,9 @@ BEGIN
     -- Удаляем данные за дату расчета для возможности перезапуска
     DELETE FROM DM.DM_ACCOUNT_TURNOVER_F WHERE on_date = i_OnDate;
     
-    -- Расчет оборотов
+    -- Расчет оборотов за один проход по проводкам: проводки сворачиваются по парам счетов
+    -- (кредит, дебет), каждая пара дает две ноги, суммы по счету считаются условной агрегацией,
+    -- а счет и курс соединяются один раз на счет, а не для каждой ноги
     INSERT INTO DM.DM_ACCOUNT_TURNOVER_F (
         on_date, 
         account_rk, 
@@ -32,48 +70,49 @@ BEGIN
     )
     SELECT 
         i_OnDate as on_date,
-        COALESCE(cr.account_rk, db.account_rk) as account_rk,
-        COALESCE(cr.credit_amount, 0) as credit_amount,
-        COALESCE(cr.credit_amount_rub, 0) as credit_amount_rub,
-        COALESCE(db.debet_amount, 0) as debet_amount,
-        COALESCE(db.debet_amount_rub, 0) as debet_amount_rub
+        turn.account_rk,
+        turn.credit_amount,
+        turn.credit_amount * COALESCE(rc.rate, 1)::NUMERIC as credit_amount_rub,
+        turn.debet_amount,
+        turn.debet_amount * COALESCE(rc.rate, 1)::NUMERIC as debet_amount_rub
     FROM 
-        -- Обороты по кредиту
         (SELECT 
-            p.credit_account_rk as account_rk,
-            SUM(p.credit_amount) as credit_amount,
-            SUM(p.credit_amount * COALESCE(er.reduced_cource, 1)) as credit_amount_rub
-        FROM DS.FT_POSTING_F p
-        LEFT JOIN DS.MD_ACCOUNT_D acc ON p.credit_account_rk = acc.account_rk 
-            AND i_OnDate BETWEEN acc.data_actual_date AND acc.data_actual_end_date
-        LEFT JOIN DS.MD_EXCHANGE_RATE_D er ON acc.currency_rk = er.currency_rk 
-            AND er.data_actual_date = i_OnDate
-        WHERE p.oper_date = i_OnDate
-        GROUP BY p.credit_account_rk
-        ) cr
-    FULL OUTER JOIN 
-        -- Обороты по дебету
-        (SELECT 
-            p.debet_account_rk as account_rk,
-            SUM(p.debet_amount) as debet_amount,
-            SUM(p.debet_amount * COALESCE(er.reduced_cource, 1)) as debet_amount_rub
-        FROM DS.FT_POSTING_F p
-        LEFT JOIN DS.MD_ACCOUNT_D acc ON p.debet_account_rk = acc.account_rk 
-            AND i_OnDate BETWEEN acc.data_actual_date AND acc.data_actual_end_date
-        LEFT JOIN DS.MD_EXCHANGE_RATE_D er ON acc.currency_rk = er.currency_rk 
-            AND er.data_actual_date = i_OnDate
-        WHERE p.oper_date = i_OnDate
-        GROUP BY p.debet_account_rk
-        ) db ON cr.account_rk = db.account_rk;
+            leg.account_rk,
+            COALESCE(SUM(leg.credit_amount), 0) as credit_amount,
+            COALESCE(SUM(leg.debet_amount), 0) as debet_amount
+        FROM 
+            (SELECT 
+                p.credit_account_rk,
+                p.debet_account_rk,
+                SUM(p.credit_amount)::NUMERIC as credit_amount,
+                SUM(p.debet_amount)::NUMERIC as debet_amount
+            FROM DS.FT_POSTING_F p
+            WHERE p.oper_date = i_OnDate
+            GROUP BY p.credit_account_rk, p.debet_account_rk
+            ) pair
+        CROSS JOIN LATERAL (VALUES 
+            (pair.credit_account_rk, pair.credit_amount, NULL::NUMERIC),
+            (pair.debet_account_rk, NULL::NUMERIC, pair.debet_amount)
+        ) AS leg(account_rk, credit_amount, debet_amount)
+        GROUP BY leg.account_rk
+        ) turn
+    LEFT JOIN DS.MD_ACCOUNT_D acc ON turn.account_rk = acc.account_rk 
+        AND i_OnDate BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+    LEFT JOIN DM.DM_RATE_CALENDAR rc ON rc.on_date = i_OnDate
+        AND rc.currency_rk = acc.currency_rk;
     
     GET DIAGNOSTICS record_count = ROW_COUNT;
     
+    -- Строки в валюте без курса в календаре (рублевая сумма по курсу 1) - WARNING и отметка в логе
+    missing_rates := ds.check_missing_rates_f('DM.DM_ACCOUNT_TURNOVER_F', i_OnDate, i_OnDate);
+    
     -- Логирование окончания
     UPDATE LOGS.etl_logs 
     SET status = 'SUCCESS', 
         rows_loaded = record_count, 
         end_time = NOW(),
         message = 'Обороты рассчитаны за ' || i_OnDate
+            || CASE WHEN missing_rates > 0 THEN ', без курса в календаре: ' || missing_rates || ' строк' ELSE '' END
     WHERE id = log_id;
     
     RAISE NOTICE 'Обороты за % рассчитаны: % записей', i_OnDate, record_count;
@@ -90,6 +129,186 @@ END;
 $$ LANGUAGE plpgsql;
 """
 
+# Процедура заполнения календаря курсов за период: курс на день - строка DS.MD_EXCHANGE_RATE_D,
+# интервал действия которой содержит этот день
+
+create_rate_calendar_procedure = """
+CREATE OR REPLACE FUNCTION ds.fill_rate_calendar_f(i_from DATE, i_to DATE)
+RETURNS VOID AS $$
+DECLARE
+    log_id INTEGER;
+    record_count INTEGER := 0;
+BEGIN
+    -- Логирование начала
+    INSERT INTO LOGS.etl_logs (table_name, status, start_time)
+    VALUES ('DM.DM_RATE_CALENDAR', 'STARTED', NOW())
+    RETURNING id INTO log_id;
+    
+    DELETE FROM DM.DM_RATE_CALENDAR WHERE on_date BETWEEN i_from AND i_to;
+    
+    -- Каждая строка курса разворачивается в дни своего интервала внутри периода
+    -- (NULL в data_actual_end_date - курс действует бессрочно); если интервалы пересекаются,
+    -- берется курс с самой поздней датой начала действия
+    INSERT INTO DM.DM_RATE_CALENDAR (on_date, currency_rk, rate)
+    SELECT DISTINCT ON (d.day::DATE, er.currency_rk)
+        d.day::DATE as on_date,
+        er.currency_rk,
+        er.reduced_cource as rate
+    FROM DS.MD_EXCHANGE_RATE_D er
+    CROSS JOIN LATERAL generate_series(GREATEST(er.data_actual_date, i_from),
+                                       LEAST(COALESCE(er.data_actual_end_date, i_to), i_to),
+                                       INTERVAL '1 day') AS d(day)
+    WHERE er.data_actual_date <= i_to
+      AND (er.data_actual_end_date IS NULL OR er.data_actual_end_date >= i_from)
+    ORDER BY d.day::DATE, er.currency_rk, er.data_actual_date DESC;
+    
+    GET DIAGNOSTICS record_count = ROW_COUNT;
+    
+    -- Логирование окончания
+    UPDATE LOGS.etl_logs 
+    SET status = 'SUCCESS', 
+        rows_loaded = record_count, 
+        end_time = NOW(),
+        message = 'Календарь курсов заполнен за ' || i_from || ' - ' || i_to
+    WHERE id = log_id;
+    
+    RAISE NOTICE 'Календарь курсов за % - % заполнен: % записей', i_from, i_to, record_count;
+    
+EXCEPTION
+    WHEN OTHERS THEN
+        UPDATE LOGS.etl_logs 
+        SET status = 'FAILED', 
+            end_time = NOW(),
+            message = 'Ошибка: ' || SQLERRM
+        WHERE id = log_id;
+        RAISE;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Очистка витрины за период: месяцы, целиком входящие в период, очищаются TRUNCATE своей
+# месячной секции (витрины секционированы по on_date), остальные даты - DELETE
+
+create_clear_period_procedure = """
+CREATE OR REPLACE FUNCTION ds.clear_period_f(i_table TEXT, i_from DATE, i_to DATE)
+RETURNS VOID AS $$
+DECLARE
+    v_month DATE;
+    v_next DATE;
+    v_partition REGCLASS;
+BEGIN
+    v_month := DATE_TRUNC('month', i_from)::DATE;
+    WHILE v_month <= i_to LOOP
+        v_next := (v_month + INTERVAL '1 month')::DATE;
+        SELECT inh.inhrelid::REGCLASS INTO v_partition
+        FROM pg_inherits inh
+        WHERE inh.inhparent = i_table::REGCLASS
+          AND inh.inhrelid = to_regclass(i_table || '_' || TO_CHAR(v_month, 'YYYY_MM'));
+        
+        IF v_partition IS NOT NULL AND v_month >= i_from AND v_next - 1 <= i_to THEN
+            EXECUTE format('TRUNCATE TABLE %s', v_partition);
+        ELSE
+            EXECUTE format('DELETE FROM %s WHERE on_date BETWEEN $1 AND $2', i_table)
+            USING GREATEST(i_from, v_month), LEAST(i_to, v_next - 1);
+        END IF;
+        v_month := v_next;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Процедура расчета оборотов за период дат одним запросом
+
+create_turnover_range_procedure = """
+CREATE OR REPLACE FUNCTION ds.fill_account_turnover_range_f(i_from DATE, i_to DATE)
+RETURNS VOID AS $$
+DECLARE
+    log_id INTEGER;
+    record_count INTEGER := 0;
+    missing_rates INTEGER := 0;
+BEGIN
+    -- Логирование начала
+    INSERT INTO LOGS.etl_logs (table_name, status, start_time)
+    VALUES ('DM.DM_ACCOUNT_TURNOVER_F', 'STARTED', NOW())
+    RETURNING id INTO log_id;
+    
+    -- Удаляем данные за весь период (целые месяцы - TRUNCATE секции)
+    PERFORM ds.clear_period_f('DM.DM_ACCOUNT_TURNOVER_F', i_from, i_to);
+    
+    -- Расчет оборотов за все даты периода: те же правила, что и в ds.fill_account_turnover_f,
+    -- но группировка идет по (дата, счет), а счет и курс берутся на дату проводки.
+    -- Проводки периода читаются один раз
+    INSERT INTO DM.DM_ACCOUNT_TURNOVER_F (
+        on_date, 
+        account_rk, 
+        credit_amount, 
+        credit_amount_rub, 
+        debet_amount, 
+        debet_amount_rub
+    )
+    SELECT 
+        turn.on_date,
+        turn.account_rk,
+        turn.credit_amount,
+        turn.credit_amount * COALESCE(rc.rate, 1)::NUMERIC as credit_amount_rub,
+        turn.debet_amount,
+        turn.debet_amount * COALESCE(rc.rate, 1)::NUMERIC as debet_amount_rub
+    FROM 
+        (SELECT 
+            pair.oper_date as on_date,
+            leg.account_rk,
+            COALESCE(SUM(leg.credit_amount), 0) as credit_amount,
+            COALESCE(SUM(leg.debet_amount), 0) as debet_amount
+        FROM 
+            (SELECT 
+                p.oper_date,
+                p.credit_account_rk,
+                p.debet_account_rk,
+                SUM(p.credit_amount)::NUMERIC as credit_amount,
+                SUM(p.debet_amount)::NUMERIC as debet_amount
+            FROM DS.FT_POSTING_F p
+            WHERE p.oper_date BETWEEN i_from AND i_to
+            GROUP BY p.oper_date, p.credit_account_rk, p.debet_account_rk
+            ) pair
+        CROSS JOIN LATERAL (VALUES 
+            (pair.credit_account_rk, pair.credit_amount, NULL::NUMERIC),
+            (pair.debet_account_rk, NULL::NUMERIC, pair.debet_amount)
+        ) AS leg(account_rk, credit_amount, debet_amount)
+        GROUP BY pair.oper_date, leg.account_rk
+        ) turn
+    LEFT JOIN DS.MD_ACCOUNT_D acc ON turn.account_rk = acc.account_rk 
+        AND turn.on_date BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+    LEFT JOIN DM.DM_RATE_CALENDAR rc ON rc.on_date = turn.on_date
+        AND rc.currency_rk = acc.currency_rk;
+    
+    GET DIAGNOSTICS record_count = ROW_COUNT;
+    
+    -- Строки в валюте без курса в календаре (рублевая сумма по курсу 1) - WARNING и отметка в логе
+    missing_rates := ds.check_missing_rates_f('DM.DM_ACCOUNT_TURNOVER_F', i_from, i_to);
+    
+    -- Логирование окончания
+    UPDATE LOGS.etl_logs 
+    SET status = 'SUCCESS', 
+        rows_loaded = record_count, 
+        end_time = NOW(),
+        message = 'Обороты рассчитаны за ' || i_from || ' - ' || i_to
+            || CASE WHEN missing_rates > 0 THEN ', без курса в календаре: ' || missing_rates || ' строк' ELSE '' END
+    WHERE id = log_id;
+    
+    RAISE NOTICE 'Обороты за % - % рассчитаны: % записей', i_from, i_to, record_count;
+    
+EXCEPTION
+    WHEN OTHERS THEN
+        UPDATE LOGS.etl_logs 
+        SET status = 'FAILED', 
+            end_time = NOW(),
+            message = 'Ошибка: ' || SQLERRM
+        WHERE id = log_id;
+        RAISE;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
 # Процедура расчета остатков по лицевым счетам
 
 create_balance_procedure = """
@@ -176,29 +395,231 @@ END;
 $$ LANGUAGE plpgsql;
 """
 
+# Процедура расчета остатков за период одним запросом
+# (i_accounts - пересчитать только эти счета, NULL - все счета)
+
+create_balance_range_procedure = """
+DROP FUNCTION IF EXISTS ds.fill_account_balance_range_f(DATE, DATE);
+
+CREATE OR REPLACE FUNCTION ds.fill_account_balance_range_f(i_from DATE, i_to DATE,
+                                                           i_accounts INTEGER[] DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    log_id INTEGER;
+    record_count INTEGER := 0;
+BEGIN
+    -- Логирование начала
+    INSERT INTO LOGS.etl_logs (table_name, status, start_time)
+    VALUES ('DM.DM_ACCOUNT_BALANCE_F', 'STARTED', NOW())
+    RETURNING id INTO log_id;
+    
+    -- Удаляем данные за весь период (входящий остаток на i_from - 1 не трогаем):
+    -- все счета - целые месяцы через TRUNCATE секции, отдельные счета - DELETE
+    IF i_accounts IS NULL THEN
+        PERFORM ds.clear_period_f('DM.DM_ACCOUNT_BALANCE_F', i_from, i_to);
+    ELSE
+        DELETE FROM DM.DM_ACCOUNT_BALANCE_F 
+        WHERE on_date BETWEEN i_from AND i_to
+          AND account_rk = ANY(i_accounts);
+    END IF;
+    
+    -- Остаток на дату = входящий остаток + нарастающая сумма оборотов со знаком по типу счета.
+    -- Как и при расчете по дням, цепочка прерывается, если счет не действовал в какой-то день:
+    -- поэтому сумма считается по непрерывным отрезкам (island) действия счета,
+    -- а входящий остаток добавляется только к отрезку, начинающемуся с i_from
+    INSERT INTO DM.DM_ACCOUNT_BALANCE_F (
+        on_date, 
+        account_rk, 
+        balance_out, 
+        balance_out_rub
+    )
+    WITH account_days AS (
+        SELECT 
+            d.on_date,
+            acc.account_rk,
+            CASE 
+                WHEN acc.char_type = 'А' THEN COALESCE(turn.debet_amount, 0) - COALESCE(turn.credit_amount, 0)
+                WHEN acc.char_type = 'П' THEN COALESCE(turn.credit_amount, 0) - COALESCE(turn.debet_amount, 0)
+                ELSE 0
+            END as delta,
+            CASE 
+                WHEN acc.char_type = 'А' THEN COALESCE(turn.debet_amount_rub, 0) - COALESCE(turn.credit_amount_rub, 0)
+                WHEN acc.char_type = 'П' THEN COALESCE(turn.credit_amount_rub, 0) - COALESCE(turn.debet_amount_rub, 0)
+                ELSE 0
+            END as delta_rub,
+            d.on_date - (ROW_NUMBER() OVER (PARTITION BY acc.account_rk ORDER BY d.on_date))::INTEGER as island
+        FROM (SELECT g.day::DATE as on_date FROM generate_series(i_from, i_to, INTERVAL '1 day') AS g(day)) d
+        JOIN DS.MD_ACCOUNT_D acc 
+            ON d.on_date BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+            AND (i_accounts IS NULL OR acc.account_rk = ANY(i_accounts))
+        LEFT JOIN DM.DM_ACCOUNT_TURNOVER_F turn 
+            ON acc.account_rk = turn.account_rk 
+            AND turn.on_date = d.on_date
+    ),
+    running AS (
+        SELECT 
+            on_date,
+            account_rk,
+            MIN(on_date) OVER (PARTITION BY account_rk, island) as island_start,
+            SUM(delta) OVER (PARTITION BY account_rk, island ORDER BY on_date) as delta_total,
+            SUM(delta_rub) OVER (PARTITION BY account_rk, island ORDER BY on_date) as delta_total_rub
+        FROM account_days
+    )
+    SELECT 
+        r.on_date,
+        r.account_rk,
+        CASE WHEN r.island_start = i_from THEN COALESCE(open_bal.balance_out, 0) ELSE 0 END 
+            + r.delta_total as balance_out,
+        CASE WHEN r.island_start = i_from THEN COALESCE(open_bal.balance_out_rub, 0) ELSE 0 END 
+            + r.delta_total_rub as balance_out_rub
+    FROM running r
+    LEFT JOIN DM.DM_ACCOUNT_BALANCE_F open_bal 
+        ON r.account_rk = open_bal.account_rk 
+        AND open_bal.on_date = i_from - 1;
+    
+    GET DIAGNOSTICS record_count = ROW_COUNT;
+    
+    -- Логирование окончания
+    UPDATE LOGS.etl_logs 
+    SET status = 'SUCCESS', 
+        rows_loaded = record_count, 
+        end_time = NOW(),
+        message = 'Остатки рассчитаны за ' || i_from || ' - ' || i_to
+            || COALESCE(' по ' || cardinality(i_accounts) || ' счетам', '')
+    WHERE id = log_id;
+    
+    RAISE NOTICE 'Остатки за % - % рассчитаны: % записей', i_from, i_to, record_count;
+    
+EXCEPTION
+    WHEN OTHERS THEN
+        UPDATE LOGS.etl_logs 
+        SET status = 'FAILED', 
+            end_time = NOW(),
+            message = 'Ошибка: ' || SQLERRM
+        WHERE id = log_id;
+        RAISE;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Отслеживание измененных дат проводок: триггеры уровня оператора на DS.FT_POSTING_F
+# записывают затронутые пары (дата операции, счет) из таблиц переходов в LOGS.dm_dirty_dates;
+# по ним refresh_dm.py пересчитывает только эти даты и счета
+
+create_dirty_dates_tracking = """
+CREATE SCHEMA IF NOT EXISTS LOGS;
+
+CREATE TABLE IF NOT EXISTS LOGS.dm_dirty_dates (
+    oper_date DATE NOT NULL,
+    account_rk INTEGER NOT NULL,
+    marked_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (oper_date, account_rk)
+);
+
+-- Полные перезагрузки проводок: загрузчик отключает построчные отметки (параметр сеанса dm.full_reload)
+-- и записывает одну строку; по ней refresh_dm пересчитывает всю витрину через run_dm
+CREATE TABLE IF NOT EXISTS LOGS.dm_full_reloads (
+    table_name VARCHAR(100) NOT NULL,
+    marked_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION ds.mark_dirty_postings_f()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- TRUNCATE + загрузка всего файла отмечена в LOGS.dm_full_reloads: пары (дата, счет) не пишутся
+    IF current_setting('dm.full_reload', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO LOGS.dm_dirty_dates (oper_date, account_rk)
+        SELECT DISTINCT p.oper_date, leg.account_rk
+        FROM new_rows p
+        CROSS JOIN LATERAL (VALUES (p.credit_account_rk), (p.debet_account_rk)) AS leg(account_rk)
+        WHERE p.oper_date IS NOT NULL AND leg.account_rk IS NOT NULL
+        ON CONFLICT DO NOTHING;
+    END IF;
+    
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        INSERT INTO LOGS.dm_dirty_dates (oper_date, account_rk)
+        SELECT DISTINCT p.oper_date, leg.account_rk
+        FROM old_rows p
+        CROSS JOIN LATERAL (VALUES (p.credit_account_rk), (p.debet_account_rk)) AS leg(account_rk)
+        WHERE p.oper_date IS NOT NULL AND leg.account_rk IS NOT NULL
+        ON CONFLICT DO NOTHING;
+    END IF;
+    
+    -- У TRUNCATE нет таблицы переходов: триггер BEFORE читает удаляемые строки из самой таблицы
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO LOGS.dm_dirty_dates (oper_date, account_rk)
+        SELECT DISTINCT p.oper_date, leg.account_rk
+        FROM DS.FT_POSTING_F p
+        CROSS JOIN LATERAL (VALUES (p.credit_account_rk), (p.debet_account_rk)) AS leg(account_rk)
+        WHERE p.oper_date IS NOT NULL AND leg.account_rk IS NOT NULL
+        ON CONFLICT DO NOTHING;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ft_posting_dirty_insert ON DS.FT_POSTING_F;
+CREATE TRIGGER ft_posting_dirty_insert
+    AFTER INSERT ON DS.FT_POSTING_F
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ds.mark_dirty_postings_f();
+
+DROP TRIGGER IF EXISTS ft_posting_dirty_update ON DS.FT_POSTING_F;
+CREATE TRIGGER ft_posting_dirty_update
+    AFTER UPDATE ON DS.FT_POSTING_F
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ds.mark_dirty_postings_f();
+
+DROP TRIGGER IF EXISTS ft_posting_dirty_delete ON DS.FT_POSTING_F;
+CREATE TRIGGER ft_posting_dirty_delete
+    AFTER DELETE ON DS.FT_POSTING_F
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ds.mark_dirty_postings_f();
+
+DROP TRIGGER IF EXISTS ft_posting_dirty_truncate ON DS.FT_POSTING_F;
+CREATE TRIGGER ft_posting_dirty_truncate
+    BEFORE TRUNCATE ON DS.FT_POSTING_F
+    FOR EACH STATEMENT EXECUTE FUNCTION ds.mark_dirty_postings_f();
+"""
+
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Создание процедуры расчета оборотов...")
-        cur.execute(create_turnover_procedure)
-        
-        print("Создание процедуры расчета остатков...")
-        cur.execute(create_balance_procedure)
-        
-        conn.commit()
-        print("Процедуры созданы успешно!")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Создание проверки календаря курсов...")
+                cur.execute(create_missing_rates_procedure)
+                
+                print("Создание процедуры расчета оборотов...")
+                cur.execute(create_turnover_procedure)
+                
+                print("Создание процедуры заполнения календаря курсов...")
+                cur.execute(create_rate_calendar_procedure)
+                
+                print("Создание процедуры очистки витрин за период...")
+                cur.execute(create_clear_period_procedure)
+                
+                print("Создание процедуры расчета оборотов за период...")
+                cur.execute(create_turnover_range_procedure)
+                
+                print("Создание процедуры расчета остатков...")
+                cur.execute(create_balance_procedure)
+                
+                print("Создание процедуры расчета остатков за период...")
+                cur.execute(create_balance_range_procedure)
+                
+                print("Создание отслеживания измененных дат проводок...")
+                cur.execute(create_dirty_dates_tracking)
+            
+            conn.commit()
+            print("Процедуры созданы успешно!")
         
     except Exception as e:
         print(f"Ошибка: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,135 @@
+"""
+Инкрементальный пересчет витрин DM после поздних проводок:
+    python refresh_dm.py
+
+Триггеры на DS.FT_POSTING_F (create_procedures.py) отмечают в LOGS.dm_dirty_dates пары
+(дата операции, счет), затронутые вставкой, изменением или удалением проводок. Обороты
+пересчитываются только за отмеченные даты, остатки - только по отмеченным счетам,
+с самой ранней отмеченной даты до конца рассчитанной витрины. После полной перезагрузки проводок
+(строка в LOGS.dm_full_reloads) вся рассчитанная витрина пересчитывается через run_dm с контрольными точками.
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
+from etl_log import EtlLogger
+from run_dm import (TURNOVER_JOBS, balance_fingerprint, chain_balance_fingerprints, contiguous_chunks,
+                    ensure_checkpoints, ensure_rate_calendar, input_fingerprints, load_checkpoints, run_dm,
+                    save_checkpoints)
+
+# Число строк витрин за период
+period_rows_sql = """
+SELECT (SELECT COUNT(*) FROM DM.DM_ACCOUNT_TURNOVER_F WHERE on_date BETWEEN %(date_from)s AND %(date_to)s),
+       (SELECT COUNT(*) FROM DM.DM_ACCOUNT_BALANCE_F WHERE on_date BETWEEN %(date_from)s AND %(date_to)s);
+"""
+
+def refresh_after_full_reload(first_date, last_date, reloaded_at):
+    """Функция для пересчета витрин после полной перезагрузки проводок: построчных отметок нет,
+    поэтому рассчитанная витрина пересчитывается run_dm с контрольными точками (resume) - заново
+    считаются только даты, входные данные которых изменились. Отметки перезагрузок по reloaded_at
+    снимаются, когда цепочка остатков доведена до last_date. Возвращает (строк оборотов, строк остатков)"""
+    print(f"Полная перезагрузка проводок {reloaded_at:%Y-%m-%d %H:%M:%S}: пересчет витрины через run_dm")
+    date_from = first_date + timedelta(days=1)
+    done_date = run_dm(date_from, last_date, jobs=TURNOVER_JOBS, resume=True)
+    with get_connection('dm') as conn, conn.cursor() as cur:
+        if done_date >= last_date:
+            cur.execute("DELETE FROM LOGS.dm_full_reloads WHERE marked_at <= %s", (reloaded_at,))
+        cur.execute(period_rows_sql, {'date_from': date_from, 'date_to': done_date})
+        turnover_rows, balance_rows = cur.fetchone()
+        conn.commit()
+    return turnover_rows, balance_rows
+
+def incremental_refresh():
+    """Функция для пересчета витрин по отмеченным датам и счетам.
+    Отметки снимаются в той же транзакции, что и пересчет (при ошибке они остаются);
+    отметки вне рассчитанной витрины отбрасываются - эти даты посчитает run_dm при расширении периода.
+    Контрольные точки пересчитанных дат обновляются, чтобы run_dm --resume их не повторял.
+    После полной перезагрузки проводок пересчет выполняет refresh_after_full_reload.
+    Возвращает (число пересчитанных строк оборотов, число пересчитанных строк остатков)"""
+    print("ИНКРЕМЕНТАЛЬНЫЙ ПЕРЕСЧЕТ ВИТРИН DM")
+    print("=" * 50)
+    start = time.perf_counter()
+    logger = EtlLogger()
+
+    # После полной перезагрузки проводок построчных отметок нет - пересчитывается вся витрина
+    with get_connection('dm') as conn, conn.cursor() as cur:
+        cur.execute("SELECT MIN(on_date), MAX(on_date) FROM DM.DM_ACCOUNT_BALANCE_F")
+        first_date, last_date = cur.fetchone()
+        cur.execute("SELECT MAX(marked_at) FROM LOGS.dm_full_reloads")
+        reloaded_at = cur.fetchone()[0]
+    if reloaded_at is not None and last_date is not None:
+        return refresh_after_full_reload(first_date, last_date, reloaded_at)
+
+    with get_connection('dm') as conn:
+        ensure_checkpoints(conn)
+        with conn.cursor() as cur:
+            # Первая дата витрины остатков - входящие остатки, расчетные даты идут после нее
+            cur.execute("SELECT MIN(on_date), MAX(on_date) FROM DM.DM_ACCOUNT_BALANCE_F")
+            first_date, last_date = cur.fetchone()
+        # Курсы на даты витрины - до снятия отметок (заполнение фиксируется): без курса в календаре
+        # рублевые суммы посчитались бы по курсу 1
+        if last_date is not None:
+            calendar_days = ensure_rate_calendar(conn, first_date, last_date)
+            if calendar_days:
+                print(f"Календарь курсов заполнен на {calendar_days} дн.")
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM LOGS.dm_dirty_dates RETURNING oper_date, account_rk")
+            marks = cur.fetchall()
+
+        dirty = [(oper_date, account_rk) for oper_date, account_rk in marks
+                 if last_date is not None and first_date < oper_date <= last_date]
+        if not dirty:
+            conn.commit()
+            print(f"Измененных дат в рассчитанной витрине нет (снято отметок: {len(marks)}).")
+            return 0, 0
+
+        dates = sorted({oper_date for oper_date, _ in dirty})
+        accounts = sorted({account_rk for _, account_rk in dirty})
+        date_from = dates[0]
+        print(f"Измененных дат: {len(dates)} ({dates[0]} - {dates[-1]}), счетов: {len(accounts)}; "
+              f"остатки пересчитываются по {last_date}")
+
+        try:
+            with conn.cursor() as cur:
+                turnover_fingerprints = input_fingerprints(conn, date_from, last_date)
+                for chunk in contiguous_chunks(dates):
+                    cur.execute("SELECT ds.fill_account_turnover_range_f(%s, %s)", (chunk[0], chunk[-1]))
+                    save_checkpoints(cur, 'TURNOVER', {d: turnover_fingerprints[d] for d in chunk}, logger.run_id)
+                cur.execute("SELECT COUNT(*) FROM DM.DM_ACCOUNT_TURNOVER_F WHERE on_date = ANY(%s)", (dates,))
+                turnover_rows = cur.fetchone()[0]
+
+                cur.execute("SELECT ds.fill_account_balance_range_f(%s, %s, %s)", (date_from, last_date, accounts))
+                cur.execute("""
+                    SELECT COUNT(*) FROM DM.DM_ACCOUNT_BALANCE_F
+                    WHERE on_date BETWEEN %s AND %s AND account_rk = ANY(%s);
+                """, (date_from, last_date, accounts))
+                balance_rows = cur.fetchone()[0]
+
+                # Цепочка отпечатков остатков продолжается от контрольной точки накануне первой измененной даты
+                opening_date = date_from - timedelta(days=1)
+                opening_fingerprint = (load_checkpoints(conn, opening_date, opening_date).get(('BALANCE', opening_date))
+                                       or balance_fingerprint(conn, opening_date))
+                save_checkpoints(cur, 'BALANCE', chain_balance_fingerprints(opening_fingerprint, turnover_fingerprints),
+                                 logger.run_id)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log_id = logger.start('DM.DM_ACCOUNT_BALANCE_F')
+            logger.end(log_id, 0, status='FAILED', message=f"Ошибка инкрементального пересчета с {date_from}: {e}")
+            raise
+
+    elapsed = time.perf_counter() - start
+    print("=" * 50)
+    print(f"Пересчитано строк: оборотов {turnover_rows:,}, остатков {balance_rows:,}, время: {elapsed:.2f} с")
+    return turnover_rows, balance_rows
+
+def main():
+    try:
+        incremental_refresh()
+    except Exception as e:
+        print(f"Ошибка инкрементального пересчета: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""
+Расчет витрин оборотов и остатков (DM) за произвольный период:
+    python run_dm.py 2018-01-01 2018-12-31 --jobs 4 --resume
+
+Завершенные этапы (обороты, остатки) каждой даты записываются в LOGS.dm_checkpoints вместе с отпечатком
+входных данных; при --resume пересчитываются только даты, для которых отпечаток или число строк витрины
+не совпадают с контрольной точкой.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from psycopg2.extras import execute_values
+from db import analyze_tables, ensure_month_partitions, get_connection, print_pool_stats
+from etl_log import EtlLogger
+
+# Число порций дат, обороты по которым считаются одновременно (каждая в своем соединении из пула);
+# 1 - обороты считаются вместе с остатками в одном соединении, по месяцам
+TURNOVER_JOBS = 4
+
+# Число повторных попыток расчета оборотов за порцию дат и пауза между ними (в секундах)
+TURNOVER_RETRIES = 2
+TURNOVER_RETRY_DELAY = 1.0
+
+# Входящие остатки на дату из DS.FT_BALANCE_F (рублевый остаток - по курсу из календаря на ту же дату;
+# остатки в валюте без курса в календаре проверяет ds.check_missing_rates_f)
+seed_balance_sql = """
+INSERT INTO DM.DM_ACCOUNT_BALANCE_F (on_date, account_rk, balance_out, balance_out_rub)
+SELECT
+    fb.on_date,
+    fb.account_rk,
+    fb.balance_out,
+    fb.balance_out * COALESCE(rc.rate, 1) as balance_out_rub
+FROM DS.FT_BALANCE_F fb
+LEFT JOIN DS.MD_ACCOUNT_D acc ON fb.account_rk = acc.account_rk
+    AND fb.on_date BETWEEN acc.data_actual_date AND acc.data_actual_end_date
+LEFT JOIN DM.DM_RATE_CALENDAR rc ON rc.on_date = fb.on_date
+    AND rc.currency_rk = acc.currency_rk
+WHERE fb.on_date = %s;
+"""
+
+# Число строк витрин по дням периода (прогресс расчета по дням)
+day_rows_sql = """
+SELECT d::DATE,
+    (SELECT COUNT(*) FROM DM.DM_ACCOUNT_TURNOVER_F turn WHERE turn.on_date = d::DATE),
+    (SELECT COUNT(*) FROM DM.DM_ACCOUNT_BALANCE_F bal WHERE bal.on_date = d::DATE)
+FROM generate_series(%s::DATE, %s::DATE, INTERVAL '1 day') d
+ORDER BY 1;
+"""
+
+# Контрольные точки расчета: этап даты считается выполненным, пока отпечаток его входных данных
+# и число строк витрины за дату совпадают с записанными
+create_checkpoints_sql = """
+CREATE SCHEMA IF NOT EXISTS LOGS;
+
+CREATE TABLE IF NOT EXISTS LOGS.dm_checkpoints (
+    on_date DATE NOT NULL,
+    stage VARCHAR(20) NOT NULL,
+    input_hash VARCHAR(32) NOT NULL,
+    row_count INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL DEFAULT now(),
+    run_id VARCHAR(32),
+    PRIMARY KEY (on_date, stage)
+);
+"""
+
+# Таблицы витрин по этапам расчета
+STAGE_TABLES = {
+    'TURNOVER': 'DM.DM_ACCOUNT_TURNOVER_F',
+    'BALANCE': 'DM.DM_ACCOUNT_BALANCE_F',
+}
+
+# Отпечатки входных данных оборотов по датам: проводки за дату, курсы на дату (из календаря курсов),
+# счета, действующие на дату
+# (число строк и сумма хешей строк - не зависит от порядка строк)
+fingerprints_sql = """
+WITH days AS (
+    SELECT d::DATE as on_date FROM generate_series(%(date_from)s::DATE, %(date_to)s::DATE, INTERVAL '1 day') d
+),
+post AS (
+    SELECT p.oper_date as on_date, COUNT(*) as cnt, SUM(hashtextextended(p::TEXT, 0)) as hash
+    FROM DS.FT_POSTING_F p
+    WHERE p.oper_date BETWEEN %(date_from)s AND %(date_to)s
+    GROUP BY p.oper_date
+),
+rate AS (
+    SELECT rc.on_date, COUNT(*) as cnt, SUM(hashtextextended(rc::TEXT, 0)) as hash
+    FROM DM.DM_RATE_CALENDAR rc
+    WHERE rc.on_date BETWEEN %(date_from)s AND %(date_to)s
+    GROUP BY rc.on_date
+),
+acc AS (
+    SELECT days.on_date, COUNT(*) as cnt, SUM(hashtextextended(a::TEXT, 0)) as hash
+    FROM days
+    JOIN DS.MD_ACCOUNT_D a ON days.on_date BETWEEN a.data_actual_date AND a.data_actual_end_date
+    GROUP BY days.on_date
+)
+SELECT days.on_date,
+       md5(concat_ws('|', post.cnt, post.hash, rate.cnt, rate.hash, acc.cnt, acc.hash))
+FROM days
+LEFT JOIN post ON post.on_date = days.on_date
+LEFT JOIN rate ON rate.on_date = days.on_date
+LEFT JOIN acc ON acc.on_date = days.on_date
+ORDER BY days.on_date;
+"""
+
+# Число строк витрин по датам и этапам
+row_counts_sql = """
+SELECT 'TURNOVER', on_date, COUNT(*) FROM DM.DM_ACCOUNT_TURNOVER_F
+WHERE on_date BETWEEN %(date_from)s AND %(date_to)s GROUP BY on_date
+UNION ALL
+SELECT 'BALANCE', on_date, COUNT(*) FROM DM.DM_ACCOUNT_BALANCE_F
+WHERE on_date BETWEEN %(date_from)s AND %(date_to)s GROUP BY on_date;
+"""
+
+def date_range(date_from, date_to):
+    """Функция для списка дат периода (включительно)"""
+    return [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+def month_batches(date_from, date_to):
+    """Функция для разбиения периода на порции по календарным месяцам"""
+    batches = []
+    batch_start = date_from
+    while batch_start <= date_to:
+        next_month = (batch_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        batch_end = min(date_to, next_month - timedelta(days=1))
+        batches.append((batch_start, batch_end))
+        batch_start = batch_end + timedelta(days=1)
+    return batches
+
+def ensure_dm_partitions(conn, date_from, date_to):
+    """Функция для создания месячных секций витрин DM на период [date_from, date_to]"""
+    return sum(ensure_month_partitions(conn, table, date_from, date_to) for table in STAGE_TABLES.values())
+
+def ensure_rate_calendar(conn, date_from, date_to):
+    """Функция для заполнения календаря курсов DM.DM_RATE_CALENDAR на даты периода, которых в нем нет
+    (после загрузки курсов календарь обновляет загрузчик). Возвращает число заполненных дат"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT d::DATE FROM generate_series(%s::DATE, %s::DATE, INTERVAL '1 day') d
+            WHERE NOT EXISTS (SELECT 1 FROM DM.DM_RATE_CALENDAR rc WHERE rc.on_date = d::DATE)
+            ORDER BY 1;
+        """, (date_from, date_to))
+        missing = [row[0] for row in cur.fetchall()]
+        for chunk in contiguous_chunks(missing):
+            cur.execute("SELECT ds.fill_rate_calendar_f(%s, %s)", (chunk[0], chunk[-1]))
+    conn.commit()
+    return len(missing)
+
+def seed_opening_balance(conn, on_date):
+    """Функция для заполнения входящих остатков на дату on_date из DS.FT_BALANCE_F.
+    Возвращает число записей (0 - если остатков на эту дату в DS нет; тогда DM не меняется)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM DS.FT_BALANCE_F WHERE on_date = %s", (on_date,))
+        if cur.fetchone()[0] == 0:
+            return 0
+        cur.execute("DELETE FROM DM.DM_ACCOUNT_BALANCE_F WHERE on_date = %s", (on_date,))
+        cur.execute(seed_balance_sql, (on_date,))
+        count = cur.rowcount
+        cur.execute("SELECT ds.check_missing_rates_f('DM.DM_ACCOUNT_BALANCE_F', %s, %s)", (on_date, on_date))
+        missing_rates = cur.fetchone()[0]
+    if missing_rates:
+        print(f"⚠️ Входящие остатки на {on_date}: {missing_rates} строк в валюте без курса в календаре - "
+              f"рублевый остаток по курсу 1")
+    return count
+
+def has_balances(conn, on_date):
+    """Функция для проверки наличия остатков в DM на дату"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM DM.DM_ACCOUNT_BALANCE_F WHERE on_date = %s)", (on_date,))
+        return cur.fetchone()[0]
+
+def contiguous_chunks(dates, max_days=None):
+    """Функция для разбиения дат на порции подряд идущих дат (не длиннее max_days)"""
+    chunks = []
+    for calc_date in sorted(dates):
+        if (chunks and calc_date == chunks[-1][-1] + timedelta(days=1)
+                and (max_days is None or len(chunks[-1]) < max_days)):
+            chunks[-1].append(calc_date)
+        else:
+            chunks.append([calc_date])
+    return chunks
+
+def ensure_checkpoints(conn):
+    """Функция для создания таблицы контрольных точок LOGS.dm_checkpoints"""
+    with conn.cursor() as cur:
+        cur.execute(create_checkpoints_sql)
+    conn.commit()
+
+def input_fingerprints(conn, date_from, date_to):
+    """Функция для отпечатков входных данных оборотов по датам периода: {дата: md5}"""
+    with conn.cursor() as cur:
+        cur.execute(fingerprints_sql, {'date_from': date_from, 'date_to': date_to})
+        return dict(cur.fetchall())
+
+def balance_fingerprint(conn, on_date):
+    """Функция для отпечатка остатков в DM на дату (для входящих остатков, рассчитанных не этим драйвером)"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT md5(concat_ws('|', COUNT(*), SUM(hashtextextended(b::TEXT, 0))))
+            FROM DM.DM_ACCOUNT_BALANCE_F b WHERE on_date = %s;
+        """, (on_date,))
+        return cur.fetchone()[0]
+
+def chain_balance_fingerprints(opening_fingerprint, turnover_fingerprints):
+    """Функция для отпечатков остатков по датам: остаток на дату зависит от остатка на предыдущую дату
+    и от входных данных оборотов за дату, поэтому отпечатки образуют цепочку"""
+    fingerprints = {}
+    previous = opening_fingerprint
+    for calc_date in sorted(turnover_fingerprints):
+        previous = hashlib.md5(f"{previous}|{turnover_fingerprints[calc_date]}".encode()).hexdigest()
+        fingerprints[calc_date] = previous
+    return fingerprints
+
+def load_checkpoints(conn, date_from, date_to):
+    """Функция для контрольных точек периода, подтвержденных витриной:
+    {(этап, дата): отпечаток} - только те, у которых число строк в DM совпадает с записанным"""
+    params = {'date_from': date_from, 'date_to': date_to}
+    with conn.cursor() as cur:
+        cur.execute(row_counts_sql, params)
+        row_counts = {(stage, on_date): count for stage, on_date, count in cur.fetchall()}
+        cur.execute("""
+            SELECT stage, on_date, input_hash, row_count FROM LOGS.dm_checkpoints
+            WHERE on_date BETWEEN %(date_from)s AND %(date_to)s;
+        """, params)
+        return {(stage, on_date): input_hash for stage, on_date, input_hash, row_count in cur.fetchall()
+                if row_counts.get((stage, on_date), 0) == row_count}
+
+def save_checkpoints(cur, stage, fingerprints, run_id=None):
+    """Функция для записи контрольных точек этапа stage по датам {дата: отпечаток}
+    в транзакции курсора cur (вместе с расчетом). Возвращает число строк витрины за эти даты"""
+    if not fingerprints:
+        return 0
+    cur.execute(f"""
+        SELECT on_date, COUNT(*) FROM {STAGE_TABLES[stage]}
+        WHERE on_date BETWEEN %s AND %s GROUP BY on_date;
+    """, (min(fingerprints), max(fingerprints)))
+    row_counts = dict(cur.fetchall())
+    execute_values(cur, """
+        INSERT INTO LOGS.dm_checkpoints (on_date, stage, input_hash, row_count, completed_at, run_id)
+        VALUES %s
+        ON CONFLICT (on_date, stage) DO UPDATE
+        SET input_hash = EXCLUDED.input_hash,
+            row_count = EXCLUDED.row_count,
+            completed_at = EXCLUDED.completed_at,
+            run_id = EXCLUDED.run_id;
+    """, [(on_date, stage, input_hash, row_counts.get(on_date, 0), run_id)
+          for on_date, input_hash in sorted(fingerprints.items())],
+        template="(%s, %s, %s, %s, now(), %s)")
+    return sum(row_counts.get(on_date, 0) for on_date in fingerprints)
+
+def clear_dirty_dates(conn, date_from, date_to):
+    """Функция для снятия отметок измененных дат [date_from, date_to], если после date_to
+    в витрине остатков нет рассчитанных дат. Возвращает число снятых отметок"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('LOGS.dm_dirty_dates') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("""
+            DELETE FROM LOGS.dm_dirty_dates
+            WHERE oper_date BETWEEN %(date_from)s AND %(date_to)s
+              AND NOT EXISTS (SELECT 1 FROM DM.DM_ACCOUNT_BALANCE_F WHERE on_date > %(date_to)s);
+        """, {'date_from': date_from, 'date_to': date_to})
+        return cur.rowcount
+
+def fill_turnovers_with_retries(date_from, date_to, logger, retries=TURNOVER_RETRIES, fingerprints=None):
+    """Функция для расчета оборотов за порцию дат в собственной транзакции с повторными попытками.
+    Если переданы отпечатки входных данных, в той же транзакции записываются контрольные точки.
+    Каждая неудачная попытка записывается в LOGS.etl_logs (запись процедуры откатывается вместе с ошибкой)"""
+    for attempt in range(1, retries + 2):
+        try:
+            with get_connection('dm') as conn, conn.cursor() as cur:
+                cur.execute("SELECT ds.fill_account_turnover_range_f(%s, %s)", (date_from, date_to))
+                if fingerprints:
+                    save_checkpoints(cur, 'TURNOVER',
+                                     {d: fingerprints[d] for d in date_range(date_from, date_to)}, logger.run_id)
+                conn.commit()
+            return True
+        except Exception as e:
+            error = str(e).strip().splitlines()[0] if str(e).strip() else repr(e)
+            period = f"{date_from}" if date_from == date_to else f"{date_from} - {date_to}"
+            log_id = logger.start('DM.DM_ACCOUNT_TURNOVER_F')
+            logger.end(log_id, 0, status='FAILED',
+                       message=f"Ошибка расчета оборотов за {period} (попытка {attempt}/{retries + 1}): {error}")
+            if attempt <= retries:
+                time.sleep(TURNOVER_RETRY_DELAY * attempt)
+    return False
+
+def calculate_turnovers_parallel(date_from, date_to, jobs=TURNOVER_JOBS, retries=TURNOVER_RETRIES,
+                                 chunk_days=None, dates=None, fingerprints=None, logger=None):
+    """Функция для параллельного расчета оборотов за период: обороты разных дат независимы,
+    поэтому порции по chunk_days подряд идущих дат распределяются между jobs соединениями пула
+    (по умолчанию - по дню на порцию для коротких периодов, до месяца - для длинных).
+    dates - только эти даты периода (например, не подтвержденные контрольными точками).
+    Возвращает список дат, которые не удалось рассчитать после всех попыток"""
+    logger = logger or EtlLogger()
+    if dates is None:
+        dates = date_range(date_from, date_to)
+    if chunk_days is None:
+        chunk_days = max(1, min(31, len(dates) // (max(1, jobs) * 4)))
+    chunks = contiguous_chunks(dates, chunk_days)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = list(executor.map(
+            lambda chunk: fill_turnovers_with_retries(chunk[0], chunk[-1], logger, retries, fingerprints),
+            chunks))
+    elapsed = time.perf_counter() - start
+    logger.flush()
+
+    failed_dates = [calc_date for chunk, success in zip(chunks, results) if not success for calc_date in chunk]
+    print(f"Обороты за {len(dates) - len(failed_dates)}/{len(dates)} дат рассчитаны за {elapsed:.2f} с "
+          f"(потоков: {max(1, jobs)}, дат в порции: {chunk_days})")
+    if failed_dates:
+        print(f"Не удалось рассчитать обороты за: {', '.join(str(d) for d in failed_dates)}")
+    return failed_dates
+
+def run_dm(date_from, date_to, jobs=1, resume=False, seed=None, chunk_days=None):
+    """Расчет витрин DM за период [date_from, date_to].
+    seed=True - входящие остатки на date_from - 1 заново берутся из DS.FT_BALANCE_F,
+    None - только если в DM их еще нет; resume=True - пропустить даты, подтвержденные контрольными
+    точками (остатки пересчитываются с первой неподтвержденной даты, обороты - только за неподтвержденные);
+    jobs > 1 - обороты сначала считаются параллельно (chunk_days - дат в порции), затем цепочка остатков.
+    Периоды обрабатываются по месяцам, каждый месяц - одной транзакцией в одном соединении.
+    Возвращает последнюю дату, по которую витрины рассчитаны"""
+    print(f"РАСЧЕТ ВИТРИН DM ЗА {date_from} - {date_to}")
+    print("=" * 50)
+    start = time.perf_counter()
+    logger = EtlLogger()
+    period_from = date_from
+
+    with get_connection('dm') as conn:
+        ensure_checkpoints(conn)
+
+        # 1. Секции витрин, календарь курсов и входящие остатки
+        opening_date = date_from - timedelta(days=1)
+        partitions = ensure_dm_partitions(conn, opening_date, date_to)
+        if partitions:
+            print(f"Создано месячных секций витрин: {partitions}")
+        calendar_days = ensure_rate_calendar(conn, opening_date, date_to)
+        if calendar_days:
+            print(f"Календарь курсов заполнен на {calendar_days} дн.")
+        seeded = False
+        if seed or (seed is None and not has_balances(conn, opening_date)):
+            count = seed_opening_balance(conn, opening_date)
+            conn.commit()
+            if count:
+                seeded = True
+                print(f"Входящие остатки на {opening_date} заполнены из DS.FT_BALANCE_F: {count} записей")
+        if not has_balances(conn, opening_date):
+            print(f"⚠️ Входящих остатков на {opening_date} нет ни в DM, ни в DS.FT_BALANCE_F - расчет от нуля")
+
+        # 2. Отпечатки входных данных и контрольные точки
+        checkpoints = load_checkpoints(conn, opening_date, date_to)
+        opening_fingerprint = checkpoints.get(('BALANCE', opening_date))
+        if seeded or opening_fingerprint is None:
+            opening_fingerprint = balance_fingerprint(conn, opening_date)
+        turnover_fingerprints = input_fingerprints(conn, date_from, date_to)
+        balance_fingerprints = chain_balance_fingerprints(opening_fingerprint, turnover_fingerprints)
+        # Чтения витрин завершаются: иначе соединение держит блокировки месячных секций, и TRUNCATE
+        # секции в потоке оборотов (ds.clear_period_f для порции в целый месяц) ждал бы его бесконечно
+        conn.commit()
+
+        turnover_dates = date_range(date_from, date_to)
+        if resume:
+            # Остатки - с первой даты, любой этап которой не подтвержден; обороты - только неподтвержденные
+            first_date = next((d for d in turnover_dates
+                               if checkpoints.get(('TURNOVER', d)) != turnover_fingerprints[d]
+                               or checkpoints.get(('BALANCE', d)) != balance_fingerprints[d]), None)
+            if first_date is None:
+                print(f"Все даты периода уже рассчитаны (контрольные точки подтверждены по {date_to}).")
+                return date_to
+            if first_date > date_from:
+                print(f"Продолжение расчета: даты по {first_date - timedelta(days=1)} подтверждены "
+                      f"контрольными точками")
+                date_from, opening_date = first_date, first_date - timedelta(days=1)
+            turnover_dates = [d for d in turnover_dates
+                              if d >= date_from and checkpoints.get(('TURNOVER', d)) != turnover_fingerprints[d]]
+
+        total_days = (date_to - date_from).days + 1
+        print(f"Расчет за {total_days} дней, обороты - за {len(turnover_dates)} "
+              f"(потоков для оборотов: {max(1, jobs)})")
+        print("-" * 50)
+
+        # 3. Обороты параллельно по датам; цепочка остатков - только до первой неудачной даты
+        if jobs > 1 and turnover_dates:
+            failed_dates = calculate_turnovers_parallel(date_from, date_to, jobs, chunk_days=chunk_days,
+                                                        dates=turnover_dates, fingerprints=turnover_fingerprints,
+                                                        logger=logger)
+            if failed_dates:
+                date_to = failed_dates[0] - timedelta(days=1)
+
+        # 4. Месяц за месяцем: (обороты) и остатки одной транзакцией вместе с контрольными точками
+        done_date = opening_date
+        total_rows = 0
+        for batch_from, batch_to in month_batches(date_from, date_to):
+            batch_start = time.perf_counter()
+            batch_dates = date_range(batch_from, batch_to)
+            try:
+                with conn.cursor() as cur:
+                    if jobs <= 1:
+                        for chunk in contiguous_chunks(d for d in turnover_dates if batch_from <= d <= batch_to):
+                            cur.execute("SELECT ds.fill_account_turnover_range_f(%s, %s)", (chunk[0], chunk[-1]))
+                            save_checkpoints(cur, 'TURNOVER', {d: turnover_fingerprints[d] for d in chunk},
+                                             logger.run_id)
+                    cur.execute("SELECT ds.fill_account_balance_range_f(%s, %s)", (batch_from, batch_to))
+                    balance_rows = save_checkpoints(cur, 'BALANCE', {d: balance_fingerprints[d] for d in batch_dates},
+                                                    logger.run_id)
+                    cur.execute(day_rows_sql, (batch_from, batch_to))
+                    day_rows = cur.fetchall()
+                    turnover_rows = sum(turnover_count for _, turnover_count, _ in day_rows)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Ошибка расчета за {batch_from} - {batch_to}: {e}")
+                print("Цепочка остатков остановлена; продолжить можно с --resume")
+                break
+
+            days = len(batch_dates)
+            rows = turnover_rows + balance_rows
+            elapsed = time.perf_counter() - batch_start
+            total_rows += rows
+            # Даты месяца считаются одним запросом: по дням - число строк, скорость - за месяц
+            for on_date, turnover_count, balance_count in day_rows:
+                print(f"  {on_date} [{(on_date - opening_date).days}/{total_days}]: "
+                      f"оборотов {turnover_count:,}, остатков {balance_count:,}")
+            done_date = batch_to
+            print(f"{batch_from} - {batch_to}: {days} дн., оборотов {turnover_rows:,}, остатков {balance_rows:,} "
+                  f"| {days / elapsed:,.1f} дн/с, {rows / elapsed:,.0f} строк/с")
+
+        # 5. Статистика планировщика по пересчитанным витринам (для следующих расчетов и формы 101)
+        if total_rows:
+            analyze_tables(conn, list(STAGE_TABLES.values()))
+
+        # 6. Если цепочка остатков доведена до конца витрины, отметки измененных дат периода
+        # (LOGS.dm_dirty_dates) уже учтены - инкрементальному пересчету повторять их не нужно
+        if done_date >= period_from:
+            clear_dirty_dates(conn, period_from, done_date)
+            conn.commit()
+
+    logger.flush()
+    elapsed = time.perf_counter() - start
+    done_days = (done_date - opening_date).days
+    print("=" * 50)
+    print(f"Рассчитано дней: {done_days}/{total_days}, строк: {total_rows:,}, время: {elapsed:.2f} с "
+          f"({done_days / elapsed:,.1f} дн/с, {total_rows / elapsed:,.0f} строк/с)")
+    print_pool_stats()
+    return done_date
+
+def main():
+    parser = argparse.ArgumentParser(description="Расчет витрин оборотов и остатков за период")
+    parser.add_argument('date_from', type=date.fromisoformat, help="первая дата периода (ГГГГ-ММ-ДД)")
+    parser.add_argument('date_to', type=date.fromisoformat, help="последняя дата периода (ГГГГ-ММ-ДД)")
+    parser.add_argument('--jobs', type=int, default=1, help="число потоков для расчета оборотов")
+    parser.add_argument('--resume', action='store_true', help="пропустить даты, подтвержденные контрольными точками")
+    parser.add_argument('--seed', action='store_true',
+                        help="заново заполнить входящие остатки из DS.FT_BALANCE_F")
+    args = parser.parse_args()
+    try:
+        run_dm(args.date_from, args.date_to, args.jobs, args.resume, True if args.seed else None)
+    except Exception as e:
+        print(f"Ошибка расчета витрин: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,63 @@
-import psycopg2  # Добавлен пробел
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
-create_f101_procedure = """
-CREATE OR REPLACE FUNCTION dm.fill_f101_round_f(i_OnDate DATE)
+# Обороты по счетам за календарные месяцы периода: одна строка на счет и месяц, чтобы форма 101
+# соединяла их с остатками один к одному; все месяцы сворачиваются за один проход по витрине оборотов
+create_turnover_period_procedure = """
+CREATE OR REPLACE FUNCTION dm.fill_account_turnover_period_f(i_from DATE, i_to DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    v_first_date DATE;
+    v_last_date DATE;
+    v_record_count INTEGER;
+BEGIN
+    v_first_date := DATE_TRUNC('month', i_from);
+    v_last_date := DATE_TRUNC('month', i_to) + INTERVAL '1 month - 1 day';
+
+    DELETE FROM DM.DM_ACCOUNT_TURNOVER_PERIOD
+    WHERE FROM_DATE BETWEEN v_first_date AND v_last_date
+        AND TO_DATE <= v_last_date;
+
+    INSERT INTO DM.DM_ACCOUNT_TURNOVER_PERIOD (
+        FROM_DATE, TO_DATE, ACCOUNT_RK,
+        CREDIT_AMOUNT, CREDIT_AMOUNT_RUB, DEBET_AMOUNT, DEBET_AMOUNT_RUB
+    )
+    SELECT
+        turn.month_start,
+        (turn.month_start + INTERVAL '1 month - 1 day')::DATE,
+        turn.account_rk,
+        SUM(turn.credit_amount),
+        SUM(turn.credit_amount_rub),
+        SUM(turn.debet_amount),
+        SUM(turn.debet_amount_rub)
+    FROM (
+        -- Месяц без учета часового пояса: DATE_TRUNC от TIMESTAMP дешевле, чем от TIMESTAMPTZ
+        SELECT DATE_TRUNC('month', on_date::TIMESTAMP)::DATE as month_start, account_rk,
+               credit_amount, credit_amount_rub, debet_amount, debet_amount_rub
+        FROM DM.DM_ACCOUNT_TURNOVER_F
+        WHERE on_date BETWEEN v_first_date AND v_last_date
+    ) turn
+    GROUP BY turn.month_start, turn.account_rk;
+
+    GET DIAGNOSTICS v_record_count = ROW_COUNT;
+    RETURN v_record_count;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Форма 101 за каждый календарный месяц с месяца i_from по месяц i_to одним запросом:
+# периоды раскладываются generate_series, остатки (только на границы месяцев) и обороты читаются
+# один раз на весь диапазон
+create_f101_range_procedure = """
+CREATE OR REPLACE FUNCTION dm.fill_f101_round_range_f(i_from DATE, i_to DATE)
 RETURNS VOID AS $$
 DECLARE
     log_id INTEGER;
-    v_from_date DATE;
-    v_to_date DATE;
-    v_prev_date DATE;
+    v_first_date DATE;
+    v_last_date DATE;
+    v_balance_dates DATE[];
     v_record_count INTEGER;
 BEGIN
     -- Логирование начала
@@ -16,14 +65,23 @@ BEGIN
     VALUES ('DM.DM_F101_ROUND_F', 'STARTED', NOW())
     RETURNING id INTO log_id;
     
-    -- Вычисляем даты отчетного периода
-    v_from_date := DATE_TRUNC('month', i_OnDate - INTERVAL '1 month');
-    v_to_date := i_OnDate - INTERVAL '1 day';
-    v_prev_date := v_from_date - INTERVAL '1 day';
+    -- Границы диапазона: первый день первого месяца и последний день последнего
+    v_first_date := DATE_TRUNC('month', i_from);
+    v_last_date := DATE_TRUNC('month', i_to) + INTERVAL '1 month - 1 day';
     
-    -- Очищаем данные за период
+    -- Даты остатков, нужные форме: канун первого месяца и последние дни всех месяцев
+    v_balance_dates := ARRAY(
+        SELECT (m - INTERVAL '1 day')::DATE
+        FROM generate_series(v_first_date, v_last_date + 1, INTERVAL '1 month') m
+    );
+    
+    -- Очищаем данные за все месяцы диапазона
     DELETE FROM DM.DM_F101_ROUND_F 
-    WHERE FROM_DATE = v_from_date AND TO_DATE = v_to_date;
+    WHERE FROM_DATE BETWEEN v_first_date AND v_last_date
+        AND TO_DATE <= v_last_date;
+    
+    -- Сворачиваем обороты по счетам за каждый месяц
+    PERFORM dm.fill_account_turnover_period_f(v_first_date, v_last_date);
     
     -- Заполняем витрину F101
     INSERT INTO DM.DM_F101_ROUND_F (
@@ -33,13 +91,18 @@ BEGIN
         TURN_CRE_RUB, TURN_CRE_VAL, TURN_CRE_TOTAL,
         BALANCE_OUT_RUB, BALANCE_OUT_VAL, BALANCE_OUT_TOTAL
     )
+    -- Остатки читаются один раз и только за нужные даты (по первичному ключу витрины)
+    WITH bal AS (
+        SELECT on_date, account_rk, balance_out_rub
+        FROM DM.DM_ACCOUNT_BALANCE_F
+        WHERE on_date = ANY(v_balance_dates)
+    )
     SELECT 
-        v_from_date as FROM_DATE,
-        v_to_date as TO_DATE,
+        p.from_date as FROM_DATE,
+        p.to_date as TO_DATE,
         las.chapter as CHAPTER,
-        LEFT(acc.account_number, 5) as LEDGER_ACCOUNT,
+        acc.ledger_account::text as LEDGER_ACCOUNT,
         acc.char_type as CHARACTERISTIC,
-        
         -- Входящие остатки
         COALESCE(SUM(CASE WHEN acc.currency_code IN ('810', '643') 
                         THEN bal_in.balance_out_rub ELSE 0 END), 0) as BALANCE_IN_RUB,
@@ -68,40 +131,221 @@ BEGIN
                         THEN bal_out.balance_out_rub ELSE 0 END), 0) as BALANCE_OUT_VAL,
         COALESCE(SUM(bal_out.balance_out_rub), 0) as BALANCE_OUT_TOTAL
         
-    FROM DS.MD_ACCOUNT_D acc
-    JOIN DS.MD_LEDGER_ACCOUNT_S las ON LEFT(acc.account_number, 5)::text = las.ledger_account::text
-
+    -- Отчетные периоды - календарные месяцы диапазона
+    FROM (SELECT m::DATE as from_date, (m + INTERVAL '1 month - 1 day')::DATE as to_date
+          FROM generate_series(v_first_date, v_last_date, INTERVAL '1 month') m) p
+    
+    -- Счета, действующие на конец периода
+    JOIN DS.MD_ACCOUNT_D acc 
+        ON acc.data_actual_date <= p.to_date 
+        AND acc.data_actual_end_date >= p.to_date
+    
+    -- Счет второго порядка, действующий на конец периода (ledger_account - вычисляемая колонка счета)
+    JOIN DS.MD_LEDGER_ACCOUNT_S las 
+        ON las.ledger_account = acc.ledger_account
+        AND las.start_date <= p.to_date
+        AND (las.end_date IS NULL OR las.end_date >= p.to_date)
     
     -- Входящие остатки (на день до начала периода)
-    LEFT JOIN DM.DM_ACCOUNT_BALANCE_F bal_in 
+    LEFT JOIN bal bal_in 
         ON acc.account_rk = bal_in.account_rk 
-        AND bal_in.on_date = v_prev_date
+        AND bal_in.on_date = p.from_date - 1
     
-    -- Обороты за период
-    LEFT JOIN DM.DM_ACCOUNT_TURNOVER_F turn 
+    -- Обороты за период (уже свернуты по счету, одна строка на счет)
+    LEFT JOIN DM.DM_ACCOUNT_TURNOVER_PERIOD turn 
         ON acc.account_rk = turn.account_rk 
-        AND turn.on_date BETWEEN v_from_date AND v_to_date
+        AND turn.from_date = p.from_date
+        AND turn.to_date = p.to_date
     
     -- Исходящие остатки (на последний день периода)
-    LEFT JOIN DM.DM_ACCOUNT_BALANCE_F bal_out 
+    LEFT JOIN bal bal_out 
         ON acc.account_rk = bal_out.account_rk 
-        AND bal_out.on_date = v_to_date
+        AND bal_out.on_date = p.to_date
+    
+    GROUP BY p.from_date, p.to_date, las.chapter, acc.ledger_account, acc.char_type
+    ORDER BY FROM_DATE, LEDGER_ACCOUNT;
+    
+    -- Получаем количество вставленных записей
+    GET DIAGNOSTICS v_record_count = ROW_COUNT;
+    
+    -- Логирование окончания
+    UPDATE LOGS.etl_logs
+    SET status = 'SUCCESS',
+        rows_loaded = v_record_count, 
+        end_time = NOW(),
+        message = 'Форма 101 рассчитана за период ' || v_first_date || ' - ' || v_last_date
+    WHERE id = log_id;
+    EXCEPTION WHEN OTHERS THEN
+    -- Логируем ошибку
+    UPDATE LOGS.etl_logs
+        SET status = 'FAILED',
+            end_time = NOW(),
+            message = 'Ошибка: ' || SQLERRM
+    WHERE id = log_id;
+    RAISE;
+    
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Форма 101 за квартал (QUARTER) или год (YEAR) из уже рассчитанных месячных форм: входящие остатки -
+# из первого месяца, обороты суммируются, исходящие остатки - из последнего месяца. Строятся только полные
+# периоды, за каждый месяц которых есть месячная форма
+create_f101_period_procedure = """
+CREATE OR REPLACE FUNCTION dm.fill_f101_round_period_f(i_period_type VARCHAR, i_from DATE, i_to DATE)
+RETURNS VOID AS $$
+DECLARE
+    log_id INTEGER;
+    v_months INTEGER;
+    v_step INTERVAL;
+    v_first_date DATE;
+    v_last_date DATE;
+    v_periods INTEGER;
+    v_complete INTEGER;
+    v_record_count INTEGER;
+BEGIN
+    -- Логирование начала
+    INSERT INTO LOGS.etl_logs (table_name, status, start_time)
+    VALUES ('DM.DM_F101_ROUND_PERIOD_F', 'STARTED', NOW())
+    RETURNING id INTO log_id;
+    
+    IF i_period_type NOT IN ('QUARTER', 'YEAR') THEN
+        RAISE EXCEPTION 'Неизвестный тип периода: % (допустимы QUARTER, YEAR)', i_period_type;
+    END IF;
     
-    WHERE acc.data_actual_date <= v_to_date 
-        AND acc.data_actual_end_date >= v_to_date
+    -- Границы диапазона: начало первого периода и последний день последнего
+    v_months := CASE i_period_type WHEN 'QUARTER' THEN 3 ELSE 12 END;
+    v_step := v_months * INTERVAL '1 month';
+    v_first_date := DATE_TRUNC(i_period_type, i_from::TIMESTAMP);
+    v_last_date := DATE_TRUNC(i_period_type, i_to::TIMESTAMP) + v_step - INTERVAL '1 day';
+    SELECT COUNT(*) INTO v_periods FROM generate_series(v_first_date, v_last_date, v_step);
     
-    GROUP BY las.chapter, LEFT(acc.account_number, 5), acc.char_type
-    ORDER BY LEDGER_ACCOUNT;
+    -- Очищаем данные за периоды диапазона
+    DELETE FROM DM.DM_F101_ROUND_PERIOD_F
+    WHERE PERIOD_TYPE = i_period_type
+        AND FROM_DATE BETWEEN v_first_date AND v_last_date;
+    
+    -- Заполняем витрину из месячных форм (12 строк на балансовый счет за год вместо дневных строк DM)
+    INSERT INTO DM.DM_F101_ROUND_PERIOD_F (
+        PERIOD_TYPE, FROM_DATE, TO_DATE, CHAPTER, LEDGER_ACCOUNT, CHARACTERISTIC,
+        BALANCE_IN_RUB, BALANCE_IN_VAL, BALANCE_IN_TOTAL,
+        TURN_DEB_RUB, TURN_DEB_VAL, TURN_DEB_TOTAL,
+        TURN_CRE_RUB, TURN_CRE_VAL, TURN_CRE_TOTAL,
+        BALANCE_OUT_RUB, BALANCE_OUT_VAL, BALANCE_OUT_TOTAL
+    )
+    -- Месячные формы диапазона
+    WITH months AS (
+        SELECT *
+        FROM DM.DM_F101_ROUND_F
+        WHERE FROM_DATE BETWEEN v_first_date AND v_last_date
+            AND TO_DATE = (FROM_DATE + INTERVAL '1 month - 1 day')::DATE
+    ),
+    -- Полные периоды: месячная форма есть за каждый месяц периода
+    periods AS (
+        SELECT DATE_TRUNC(i_period_type, m.from_date::TIMESTAMP)::DATE as from_date,
+               (DATE_TRUNC(i_period_type, m.from_date::TIMESTAMP) + v_step - INTERVAL '1 day')::DATE as to_date
+        FROM months m
+        GROUP BY 1, 2
+        HAVING COUNT(DISTINCT m.from_date) = v_months
+    )
+    SELECT 
+        i_period_type as PERIOD_TYPE,
+        p.from_date as FROM_DATE,
+        p.to_date as TO_DATE,
+        m.chapter as CHAPTER,
+        m.ledger_account as LEDGER_ACCOUNT,
+        m.characteristic as CHARACTERISTIC,
+        
+        -- Входящие остатки - из первого месяца периода
+        COALESCE(SUM(m.balance_in_rub) FILTER (WHERE m.from_date = p.from_date), 0) as BALANCE_IN_RUB,
+        COALESCE(SUM(m.balance_in_val) FILTER (WHERE m.from_date = p.from_date), 0) as BALANCE_IN_VAL,
+        COALESCE(SUM(m.balance_in_total) FILTER (WHERE m.from_date = p.from_date), 0) as BALANCE_IN_TOTAL,
+        
+        -- Обороты - сумма по месяцам
+        SUM(m.turn_deb_rub) as TURN_DEB_RUB,
+        SUM(m.turn_deb_val) as TURN_DEB_VAL,
+        SUM(m.turn_deb_total) as TURN_DEB_TOTAL,
+        SUM(m.turn_cre_rub) as TURN_CRE_RUB,
+        SUM(m.turn_cre_val) as TURN_CRE_VAL,
+        SUM(m.turn_cre_total) as TURN_CRE_TOTAL,
+        
+        -- Исходящие остатки - из последнего месяца периода
+        COALESCE(SUM(m.balance_out_rub) FILTER (WHERE m.to_date = p.to_date), 0) as BALANCE_OUT_RUB,
+        COALESCE(SUM(m.balance_out_val) FILTER (WHERE m.to_date = p.to_date), 0) as BALANCE_OUT_VAL,
+        COALESCE(SUM(m.balance_out_total) FILTER (WHERE m.to_date = p.to_date), 0) as BALANCE_OUT_TOTAL
+        
+    FROM periods p
+    JOIN months m ON m.from_date BETWEEN p.from_date AND p.to_date
+    GROUP BY p.from_date, p.to_date, m.chapter, m.ledger_account, m.characteristic
+    ORDER BY FROM_DATE, LEDGER_ACCOUNT;
     
     -- Получаем количество вставленных записей
     GET DIAGNOSTICS v_record_count = ROW_COUNT;
     
+    SELECT COUNT(DISTINCT FROM_DATE) INTO v_complete
+    FROM DM.DM_F101_ROUND_PERIOD_F
+    WHERE PERIOD_TYPE = i_period_type
+        AND FROM_DATE BETWEEN v_first_date AND v_last_date;
+    
     -- Логирование окончания
     UPDATE LOGS.etl_logs
     SET status = 'SUCCESS',
         rows_loaded = v_record_count, 
         end_time = NOW(),
-        message = 'Форма 101 рассчитана за период ' || v_from_date || ' - ' || v_to_date
+        message = 'Форма 101 (' || i_period_type || ') рассчитана за период ' || v_first_date || ' - ' || v_last_date
+                  || ': полных периодов ' || v_complete || ' из ' || v_periods
+    WHERE id = log_id;
+    EXCEPTION WHEN OTHERS THEN
+    -- Логируем ошибку
+    UPDATE LOGS.etl_logs
+        SET status = 'FAILED',
+            end_time = NOW(),
+            message = 'Ошибка: ' || SQLERRM
+    WHERE id = log_id;
+    RAISE;
+    
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Форма 101 за месяц, предшествующий отчетной дате (первому дню следующего месяца). Формы строятся
+# только за полные месяцы, поэтому дата не с первого числа отклоняется, а не превращается молча в другой период
+create_f101_procedure = """
+CREATE OR REPLACE FUNCTION dm.fill_f101_round_f(i_OnDate DATE)
+RETURNS VOID AS $$
+BEGIN
+    IF i_OnDate <> DATE_TRUNC('month', i_OnDate)::DATE THEN
+        RAISE EXCEPTION 'Отчетная дата % - не первый день месяца: форма 101 строится за полный предыдущий месяц', i_OnDate;
+    END IF;
+    PERFORM dm.fill_f101_round_range_f((i_OnDate - INTERVAL '1 month')::DATE, (i_OnDate - INTERVAL '1 day')::DATE);
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Публикация формы 101 для читателей: представление DM.DM_F101_ROUND_MV обновляется по разнице с
+# DM.DM_F101_ROUND_F, чтение представления во время обновления не блокируется и видит прежние данные
+create_f101_publish_procedure = """
+CREATE OR REPLACE FUNCTION dm.publish_f101_round_f()
+RETURNS VOID AS $$
+DECLARE
+    log_id INTEGER;
+    v_record_count INTEGER;
+BEGIN
+    -- Логирование начала
+    INSERT INTO LOGS.etl_logs (table_name, status, start_time)
+    VALUES ('DM.DM_F101_ROUND_MV', 'STARTED', NOW())
+    RETURNING id INTO log_id;
+    
+    REFRESH MATERIALIZED VIEW CONCURRENTLY DM.DM_F101_ROUND_MV;
+    
+    SELECT COUNT(*) INTO v_record_count FROM DM.DM_F101_ROUND_MV;
+    
+    -- Логирование окончания
+    UPDATE LOGS.etl_logs
+    SET status = 'SUCCESS',
+        rows_loaded = v_record_count, 
+        end_time = NOW(),
+        message = 'Форма 101 опубликована'
     WHERE id = log_id;
     EXCEPTION WHEN OTHERS THEN
     -- Логируем ошибку
@@ -118,24 +362,26 @@ $$ LANGUAGE plpgsql;
 
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Создание процедуры расчета F101...")
-        cur.execute(create_f101_procedure)
-        
-        conn.commit()
-        print("Процедура создана успешно!")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Создание процедуры свертки оборотов за период...")
+                cur.execute(create_turnover_period_procedure)
+                
+                print("Создание процедур расчета F101...")
+                cur.execute(create_f101_range_procedure)
+                cur.execute(create_f101_procedure)
+                
+                print("Создание процедуры расчета F101 за квартал и год...")
+                cur.execute(create_f101_period_procedure)
+                
+                print("Создание процедуры публикации F101...")
+                cur.execute(create_f101_publish_procedure)
+            
+            conn.commit()
+            print("Процедура создана успешно!")
         
     except Exception as e:
         print(f"Ошибка: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
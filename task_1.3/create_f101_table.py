@@ -1,5 +1,7 @@
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
 create_schema_sql = """
 CREATE SCHEMA IF NOT EXISTS DM;
@@ -27,30 +29,78 @@ CREATE TABLE IF NOT EXISTS DM.DM_F101_ROUND_F (
     BALANCE_OUT_VAL NUMERIC(23,8),
     BALANCE_OUT_TOTAL NUMERIC(23,8)
 );
+
+--Опубликованная форма 101 для читателей отчетов: пересчет идет в DM.DM_F101_ROUND_F,
+--а в представление результат переносится REFRESH MATERIALIZED VIEW CONCURRENTLY (без блокировки чтения).
+--Только месячные формы: колонки совпадают с DM.DM_F101_ROUND_F, экспорт из представления загружается
+--в DM.DM_F101_ROUND_F_V2; квартальные и годовые формы (с PERIOD_TYPE) читаются из DM.DM_F101_ROUND_PERIOD_F
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS DM.DM_F101_ROUND_MV AS
+SELECT
+    FROM_DATE, TO_DATE, CHAPTER, LEDGER_ACCOUNT, CHARACTERISTIC,
+    BALANCE_IN_RUB, BALANCE_IN_VAL, BALANCE_IN_TOTAL,
+    TURN_DEB_RUB, TURN_DEB_VAL, TURN_DEB_TOTAL,
+    TURN_CRE_RUB, TURN_CRE_VAL, TURN_CRE_TOTAL,
+    BALANCE_OUT_RUB, BALANCE_OUT_VAL, BALANCE_OUT_TOTAL
+FROM DM.DM_F101_ROUND_F
+WITH DATA;
+
+--Уникальный индекс обязателен для обновления CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS dm_f101_round_mv_key_idx
+    ON DM.DM_F101_ROUND_MV (FROM_DATE, TO_DATE, LEDGER_ACCOUNT, CHARACTERISTIC);
+
+--Форма 101 за квартал и год, собранная из месячных форм
+
+CREATE TABLE IF NOT EXISTS DM.DM_F101_ROUND_PERIOD_F (
+    PERIOD_TYPE VARCHAR(7) NOT NULL CHECK (PERIOD_TYPE IN ('QUARTER', 'YEAR')),
+    FROM_DATE DATE NOT NULL,
+    TO_DATE DATE NOT NULL,
+    CHAPTER CHAR(1),
+    LEDGER_ACCOUNT CHAR(5) NOT NULL,
+    CHARACTERISTIC CHAR(1) NOT NULL,
+    BALANCE_IN_RUB NUMERIC(23,8),
+    BALANCE_IN_VAL NUMERIC(23,8),
+    BALANCE_IN_TOTAL NUMERIC(23,8),
+    TURN_DEB_RUB NUMERIC(23,8),
+    TURN_DEB_VAL NUMERIC(23,8),
+    TURN_DEB_TOTAL NUMERIC(23,8),
+    TURN_CRE_RUB NUMERIC(23,8),
+    TURN_CRE_VAL NUMERIC(23,8),
+    TURN_CRE_TOTAL NUMERIC(23,8),
+    BALANCE_OUT_RUB NUMERIC(23,8),
+    BALANCE_OUT_VAL NUMERIC(23,8),
+    BALANCE_OUT_TOTAL NUMERIC(23,8),
+    PRIMARY KEY (FROM_DATE, TO_DATE, LEDGER_ACCOUNT, CHARACTERISTIC)
+);
+
+--Обороты по лицевым счетам за отчетный период (одна строка на счет и период)
+
+CREATE TABLE IF NOT EXISTS DM.DM_ACCOUNT_TURNOVER_PERIOD (
+    FROM_DATE DATE NOT NULL,
+    TO_DATE DATE NOT NULL,
+    ACCOUNT_RK INTEGER NOT NULL,
+    CREDIT_AMOUNT NUMERIC(23,8),
+    CREDIT_AMOUNT_RUB NUMERIC(23,8),
+    DEBET_AMOUNT NUMERIC(23,8),
+    DEBET_AMOUNT_RUB NUMERIC(23,8),
+    PRIMARY KEY (FROM_DATE, TO_DATE, ACCOUNT_RK)
+);
 """ 
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Creating schemas...")
-        cur.execute(create_schema_sql)
-        
-        print("Creating tables...")
-        cur.execute(create_f101_table)
-        
-        conn.commit()
-        print("Schemas and tables created successfully.")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Creating schemas...")
+                cur.execute(create_schema_sql)
+                
+                print("Creating tables...")
+                cur.execute(create_f101_table)
+            
+            conn.commit()
+            print("Schemas and tables created successfully.")
         
     except Exception as e:
         print(f"Error: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Расчет формы 101 за все месяцы периода:
+    python run_f101.py 2018-01-01 2018-12-31
+    python run_f101.py 2018-01-01 2018-12-31 --by-month
+    python run_f101.py 2018-01-01 2018-12-31 --rollup quarter --rollup year
+    python run_f101.py 2018-01-01 2018-12-31 --no-publish
+
+По умолчанию все месячные формы строятся одним вызовом dm.fill_f101_round_range_f - остатки и обороты
+читаются за весь период один раз. --by-month - прежний способ: отдельный вызов dm.fill_f101_round_f
+на каждый месяц (для сравнения времени). --rollup - после месячных форм собрать из них формы
+за полные кварталы и годы периода (dm.fill_f101_round_period_f -> DM.DM_F101_ROUND_PERIOD_F).
+После расчета формы публикуются для читателей отчетов: DM.DM_F101_ROUND_MV обновляется
+REFRESH MATERIALIZED VIEW CONCURRENTLY, чтение представления не ждет пересчета и не видит пустых периодов;
+--no-publish - только рассчитать формы, представление (и экспорт из него) остается прежним.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
+
+# Число строк формы по месяцам периода
+month_rows_sql = """
+SELECT FROM_DATE, COUNT(*)
+FROM DM.DM_F101_ROUND_F
+WHERE FROM_DATE BETWEEN %s AND %s
+GROUP BY FROM_DATE;
+"""
+
+# Месяцы, на конец которых в витрине остатков нет данных (форма по ним будет нулевой)
+missing_balances_sql = """
+SELECT (m + INTERVAL '1 month - 1 day')::DATE
+FROM generate_series(%s::DATE, %s::DATE, INTERVAL '1 month') m
+WHERE NOT EXISTS (
+    SELECT 1 FROM DM.DM_ACCOUNT_BALANCE_F bal
+    WHERE bal.on_date = (m + INTERVAL '1 month - 1 day')::DATE
+);
+"""
+
+# Число строк квартальных и годовых форм по периодам
+period_rows_sql = """
+SELECT FROM_DATE, TO_DATE, COUNT(*)
+FROM DM.DM_F101_ROUND_PERIOD_F
+WHERE PERIOD_TYPE = %s AND FROM_DATE BETWEEN %s AND %s
+GROUP BY FROM_DATE, TO_DATE
+ORDER BY FROM_DATE;
+"""
+
+# Типы периодов для сборки из месячных форм
+ROLLUP_PERIODS = {'quarter': 'QUARTER', 'year': 'YEAR'}
+
+def report_months(date_from, date_to):
+    """Функция для разбиения периода на отчетные месяцы: список первых дней месяцев"""
+    months = []
+    month = date_from.replace(day=1)
+    while month <= date_to:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+def run_f101(date_from, date_to, by_month=False):
+    """Функция для расчета формы 101 за каждый месяц с месяца date_from по месяц date_to.
+    Возвращает словарь {первый день месяца: (число строк, время в секундах)}; при расчете
+    одним вызовом время месяца - доля общего времени"""
+    months = report_months(date_from, date_to)
+    print("=" * 60)
+    print(f"РАСЧЕТ ФОРМЫ 101 ЗА {months[0]:%Y-%m} - {months[-1]:%Y-%m} ({len(months)} мес.)")
+    print("=" * 60)
+
+    timings = {}
+    with get_connection('report') as conn, conn.cursor() as cur:
+        cur.execute(missing_balances_sql, (months[0], months[-1]))
+        for (month_end,) in cur.fetchall():
+            print(f"⚠️ Нет остатков DM на {month_end} - исходящие остатки формы за месяц будут нулевыми")
+
+        start = time.perf_counter()
+        if by_month:
+            for month in months:
+                month_start = time.perf_counter()
+                report_date = (month + timedelta(days=32)).replace(day=1)
+                cur.execute("SELECT dm.fill_f101_round_f(%s);", (report_date,))
+                timings[month] = time.perf_counter() - month_start
+        else:
+            cur.execute("SELECT dm.fill_f101_round_range_f(%s, %s);", (months[0], months[-1]))
+        conn.commit()
+        elapsed = time.perf_counter() - start
+
+        cur.execute(month_rows_sql, (months[0], months[-1]))
+        rows = dict(cur.fetchall())
+
+    print(f"{'Месяц':<12}{'строк':>8}{'время, мс':>14}")
+    print("-" * 60)
+    result = {}
+    for month in months:
+        seconds = timings.get(month, elapsed / len(months))
+        result[month] = (rows.get(month, 0), seconds)
+        print(f"{month.strftime('%Y-%m'):<12}{rows.get(month, 0):>8}{seconds * 1000:>14.1f}")
+    print("=" * 60)
+    mode = "по месяцам" if by_month else "одним вызовом (время месяца - доля общего)"
+    print(f"Рассчитано месяцев: {len(months)}, строк: {sum(rows.values()):,}, время: {elapsed:.2f} с, {mode}")
+    return result
+
+def rollup_f101(date_from, date_to, period):
+    """Функция для сборки формы 101 за полные кварталы или годы (period - 'quarter' или 'year')
+    из месячных форм периода. Возвращает словарь {(начало, конец периода): число строк}"""
+    period_type = ROLLUP_PERIODS[period]
+    start = time.perf_counter()
+    with get_connection('report') as conn, conn.cursor() as cur:
+        cur.execute("SELECT dm.fill_f101_round_period_f(%s, %s, %s);", (period_type, date_from, date_to))
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        cur.execute(period_rows_sql, (period_type, date_from.replace(month=1, day=1), date_to))
+        periods = {(from_date, to_date): count for from_date, to_date, count in cur.fetchall()}
+
+    for (from_date, to_date), count in periods.items():
+        print(f"{period_type} {from_date} - {to_date}: строк {count}")
+    if not periods:
+        print(f"⚠️ {period_type}: нет полных периодов - не хватает месячных форм")
+    print(f"Сборка {period_type} из месячных форм: {elapsed * 1000:.1f} мс")
+    return periods
+
+def publish_f101():
+    """Функция для публикации рассчитанных форм в DM.DM_F101_ROUND_MV (dm.publish_f101_round_f).
+    Возвращает число строк в представлении"""
+    start = time.perf_counter()
+    with get_connection('report') as conn, conn.cursor() as cur:
+        cur.execute("SELECT dm.publish_f101_round_f();")
+        conn.commit()
+        cur.execute("SELECT COUNT(*) FROM DM.DM_F101_ROUND_MV;")
+        count = cur.fetchone()[0]
+    print(f"Форма 101 опубликована в DM.DM_F101_ROUND_MV: строк {count:,}, "
+          f"время: {(time.perf_counter() - start) * 1000:.1f} мс")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Расчет формы 101 за все месяцы периода")
+    parser.add_argument('date_from', type=date.fromisoformat, help="дата в первом месяце периода (ГГГГ-ММ-ДД)")
+    parser.add_argument('date_to', type=date.fromisoformat, help="дата в последнем месяце периода (ГГГГ-ММ-ДД)")
+    parser.add_argument('--by-month', action='store_true',
+                        help="считать каждый месяц отдельным вызовом dm.fill_f101_round_f")
+    parser.add_argument('--rollup', action='append', choices=list(ROLLUP_PERIODS), default=[],
+                        help="собрать из месячных форм формы за полные кварталы или годы (можно повторить)")
+    parser.add_argument('--no-publish', dest='publish', action='store_false',
+                        help="не публиковать формы в DM.DM_F101_ROUND_MV (REFRESH ... CONCURRENTLY)")
+    args = parser.parse_args()
+    try:
+        run_f101(args.date_from, args.date_to, args.by_month)
+        for period in args.rollup:
+            rollup_f101(args.date_from, args.date_to, period)
+        if args.publish:
+            publish_f101()
+    except Exception as e:
+        print(f"Ошибка расчета формы 101: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,26 @@
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Удаление витрин...")
-        
-        # Удаляем таблицы витрин
-        cur.execute("DROP TABLE IF EXISTS DM.DM_F101_ROUND_F_V2 CASCADE;")
-        
-        # Удаляем схему если пустая (опционально)
-        # cur.execute("DROP SCHEMA IF EXISTS DM CASCADE;")
-        
-        conn.commit()
-        print("Копия витрины удалена!")
-        print("Теперь можно заново создавать!")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Удаление витрин...")
+                
+                # Удаляем таблицы витрин
+                cur.execute("DROP TABLE IF EXISTS DM.DM_F101_ROUND_F_V2 CASCADE;")
+                
+                # Удаляем схему если пустая (опционально)
+                # cur.execute("DROP SCHEMA IF EXISTS DM CASCADE;")
+            
+            conn.commit()
+            print("Копия витрины удалена!")
+            print("Теперь можно заново создавать!")
         
     except Exception as e:
         print(f"Ошибка: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
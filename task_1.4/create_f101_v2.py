@@ -1,5 +1,7 @@
-import psycopg2
-from config import DB_CONFIG
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
 
 create_schema_sql = """
 CREATE SCHEMA IF NOT EXISTS DM;
@@ -30,27 +32,19 @@ CREATE TABLE IF NOT EXISTS DM.DM_F101_ROUND_F_V2 (
 """ 
 def main():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print("Creating schemas...")
-        cur.execute(create_schema_sql)
-        
-        print("Creating tables...")
-        cur.execute(create_f101_v2)
-        
-        conn.commit()
-        print("Schemas and tables created successfully.")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                print("Creating schemas...")
+                cur.execute(create_schema_sql)
+                
+                print("Creating tables...")
+                cur.execute(create_f101_v2)
+            
+            conn.commit()
+            print("Schemas and tables created successfully.")
         
     except Exception as e:
         print(f"Error: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,63 +1,52 @@
-import psycopg2
+import argparse
+import os
+import sys
 import csv
 from datetime import datetime
-from config import DB_CONFIG
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
+from etl_log import EtlLogger
 
-def export_to_csv(filename):
-    conn = None
-    log_id = None
+# Источники экспорта: опубликованная форма (по умолчанию - DM.DM_F101_ROUND_MV не меняется
+# во время ночного пересчета) и витрина, в которую идет пересчет
+EXPORT_SOURCES = ('dm.dm_f101_round_mv', 'dm.dm_f101_round_f')
+
+def export_to_csv(filename, source_table='dm.dm_f101_round_mv'):
+    if source_table not in EXPORT_SOURCES:
+        raise ValueError(f"Неизвестный источник экспорта: {source_table} (допустимы {', '.join(EXPORT_SOURCES)})")
+    logger = EtlLogger()
+    # Логируем начало процесса экспорта
+    log_id = logger.start(source_table, f'Экспорт в файл {filename}')
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        # Логируем начало процесса экспорта
-        cur.execute("""
-            INSERT INTO LOGS.etl_logs (table_name, status, start_time, message)
-            VALUES (%s, %s, NOW(), %s)
-            RETURNING id
-        """, ('dm.dm_f101_round_f', 'STARTED', f'Экспорт в файл {filename}'))
-        log_id = cur.fetchone()[0]
-        conn.commit()
-        
-        # Выбираем данные из таблицы
-        cur.execute("SELECT * FROM dm.dm_f101_round_f;")
-        rows = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        
-        # Записываем данные в CSV файл
-        with open(filename, mode='w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(colnames)  # заголовок
-            writer.writerows(rows)
+        with get_connection('report') as conn:
+            cur = conn.cursor()
+            
+            # Выбираем данные из таблицы
+            cur.execute(f"SELECT * FROM {source_table};")
+            rows = cur.fetchall()
+            colnames = [desc[0] for desc in cur.description]
+            
+            # Записываем данные в CSV файл
+            with open(filename, mode='w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(colnames)  # заголовок
+                writer.writerows(rows)
         
         # Логируем успешное завершение
-        cur.execute("""
-            UPDATE LOGS.etl_logs
-            SET status = %s,
-                rows_loaded = %s,
-                end_time = NOW(),
-                message = %s
-            WHERE id = %s
-        """, ('SUCCESS', len(rows), f'Экспорт успешно завершён в файл {filename}', log_id))
-        conn.commit()
+        logger.end(log_id, len(rows), 'SUCCESS', f'Экспорт успешно завершён в файл {filename}')
         
         print(f"Экспорт завершён успешно. Записано строк: {len(rows)}")
         
     except Exception as e:
-        if conn and log_id:
-            cur.execute("""
-                UPDATE LOGS.etl_logs
-                SET status = %s,
-                    end_time = NOW(),
-                    message = %s
-                WHERE id = %s
-            """, ('FAILED', str(e), log_id))
-            conn.commit()
+        logger.end(log_id, 0, 'FAILED', str(e))
         print(f"Ошибка экспорта: {e}")
     finally:
-        if conn:
-            conn.close()
+        logger.flush()
 
 if __name__ == "__main__":
-    export_to_csv('f101_export.csv')
-
+    parser = argparse.ArgumentParser(description="Экспорт формы 101 в CSV")
+    parser.add_argument('--source', choices=EXPORT_SOURCES, default='dm.dm_f101_round_mv',
+                        help="таблица или представление, из которого выгружаются данные")
+    parser.add_argument('--file', default='f101_export.csv', help="имя CSV-файла")
+    args = parser.parse_args()
+    export_to_csv(args.file, args.source)
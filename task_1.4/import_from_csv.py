@@ -1,71 +1,49 @@
-import psycopg2
+import os
+import sys
 import csv
 from datetime import datetime
-from config import DB_CONFIG
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db import get_connection
+from etl_log import EtlLogger
 
 def import_from_csv(filename):
-    conn = None
-    log_id = None
+    logger = EtlLogger()
     rows_imported = 0
+    # Логируем начало процесса
+    log_id = logger.start('dm.dm_f101_round_f_v2', f'Импорт из файла {filename}')
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-
-        # Логируем начало процесса
-        cur.execute("""
-            INSERT INTO LOGS.etl_logs (table_name, status, start_time, message)
-            VALUES (%s, %s, NOW(), %s)
-            RETURNING id
-        """, ('dm.dm_f101_round_f_v2', 'STARTED', f'Импорт из файла {filename}'))
-        log_id = cur.fetchone()[0]
-        conn.commit()
-        
-        print(f"Импорт данных в dm.dm_f101_round_f_v2 из {filename} - старт {datetime.now()}")
-
-        # Очищаем таблицу перед импортом
-        cur.execute("DELETE FROM dm.dm_f101_round_f_v2;")
-
-        with open(filename, mode='r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            headers = next(reader)  # пропускаем заголовок
+        with get_connection('etl') as conn:
+            cur = conn.cursor()
             
-            insert_query = f"""
-                INSERT INTO dm.dm_f101_round_f_v2 ({','.join(headers)})
-                VALUES ({','.join(['%s'] * len(headers))})
-            """
-            
-            data = list(reader)
-            rows_imported = len(data)
-            cur.executemany(insert_query, data)
+            print(f"Импорт данных в dm.dm_f101_round_f_v2 из {filename} - старт {datetime.now()}")
+
+            # Очищаем таблицу перед импортом
+            cur.execute("DELETE FROM dm.dm_f101_round_f_v2;")
+
+            with open(filename, mode='r', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                headers = next(reader)  # пропускаем заголовок
+                
+                insert_query = f"""
+                    INSERT INTO dm.dm_f101_round_f_v2 ({','.join(headers)})
+                    VALUES ({','.join(['%s'] * len(headers))})
+                """
+                
+                data = list(reader)
+                rows_imported = len(data)
+                cur.executemany(insert_query, data)
 
-        conn.commit()
+            conn.commit()
         print(f"Импорт завершён успешно - {datetime.now()}. Импортировано строк: {rows_imported}")
 
         # Логируем успешное завершение
-        cur.execute("""
-            UPDATE LOGS.etl_logs
-            SET status = %s,
-                rows_loaded = %s,
-                end_time = NOW(),
-                message = %s
-            WHERE id = %s
-        """, ('SUCCESS', rows_imported, f'Импорт успешно завершён из файла {filename}', log_id))
-        conn.commit()
+        logger.end(log_id, rows_imported, 'SUCCESS', f'Импорт успешно завершён из файла {filename}')
 
     except Exception as e:
-        if conn and log_id:
-            cur.execute("""
-                UPDATE LOGS.etl_logs
-                SET status = %s,
-                    end_time = NOW(),
-                    message = %s
-                WHERE id = %s
-            """, ('FAILED', str(e), log_id))
-            conn.commit()
+        logger.end(log_id, 0, 'FAILED', str(e))
         print(f"Ошибка импорта: {e}")
     finally:
-        if conn:
-            conn.close()
+        logger.flush()
 
 if __name__ == "__main__":
     import_from_csv('f101_export.csv')